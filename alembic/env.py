@@ -46,8 +46,7 @@ def run_migrations_offline() -> None:
     script output.
 
     """
-    # url = config.get_main_option("sqlalchemy.url")
-    url = os.getenv('POSTGRESQL_URL')
+    url = config.get_main_option("sqlalchemy.url") or os.getenv('POSTGRESQL_URL')
     context.configure(
         url=url,
         target_metadata=target_metadata,
@@ -67,7 +66,8 @@ def run_migrations_online() -> None:
 
     """
     configuration = config.get_section(config.config_ini_section, {})
-    configuration['sqlalchemy.url'] = os.getenv('POSTGRESQL_URL')
+    # A url set on the Config (e.g. by the test fixtures) takes precedence over the environment
+    configuration['sqlalchemy.url'] = configuration.get('sqlalchemy.url') or os.getenv('POSTGRESQL_URL')
     connectable = engine_from_config(
         configuration,
         prefix="sqlalchemy.",
@@ -0,0 +1,48 @@
+"""Create base tables
+
+Revision ID: 0b8d5e3f7a21
+Revises: 
+Create Date: 2026-10-17 12:20:05.601347
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b8d5e3f7a21'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The tables as they were before the first migration (they used to be created by create_all on startup),
+    # so that a fresh database can be built with alembic upgrade head alone
+    op.create_table('guilds',
+                    sa.Column('guild_id', sa.String(), nullable=False),
+                    sa.Column('notification_channel_id', sa.String(), nullable=False),
+                    sa.PrimaryKeyConstraint('guild_id')
+                    )
+    op.create_table('streamers',
+                    sa.Column('streamer_id', sa.String(), nullable=False),
+                    sa.PrimaryKeyConstraint('streamer_id')
+                    )
+    op.create_table('user_subscriptions',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.String(), nullable=False),
+                    sa.Column('guild_id', sa.String(), nullable=False),
+                    sa.Column('streamer_id', sa.String(), nullable=False),
+                    sa.ForeignKeyConstraint(['guild_id'], ['guilds.guild_id'], ondelete='CASCADE'),
+                    sa.ForeignKeyConstraint(['streamer_id'], ['streamers.streamer_id']),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('user_id', 'guild_id', 'streamer_id', name='uix_1')
+                    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_subscriptions')
+    op.drop_table('streamers')
+    op.drop_table('guilds')
@@ -0,0 +1,45 @@
+"""Added notification outbox table
+
+Revision ID: 3f1b7c2d9a64
+Revises: 9e4c9ca49925
+Create Date: 2026-10-17 09:12:44.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1b7c2d9a64'
+down_revision: Union[str, None] = '9e4c9ca49925'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('notification_outbox',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('idempotency_key', sa.String(), nullable=False),
+                    sa.Column('guild_id', sa.String(), nullable=False),
+                    sa.Column('channel_id', sa.String(), nullable=False),
+                    sa.Column('payload', sa.JSON(), nullable=False),
+                    sa.Column('status', sa.String(), nullable=False),
+                    sa.Column('attempts', sa.Integer(), nullable=False),
+                    sa.Column('sent_count', sa.Integer(), nullable=False),
+                    sa.Column('next_attempt_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                              nullable=False),
+                    sa.Column('last_error', sa.String(), nullable=True),
+                    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                              nullable=False),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('idempotency_key')
+                    )
+    op.create_index('ix_notification_outbox_status_next_attempt_at', 'notification_outbox',
+                    ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notification_outbox_status_next_attempt_at', table_name='notification_outbox')
+    op.drop_table('notification_outbox')
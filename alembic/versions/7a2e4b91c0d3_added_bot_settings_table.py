@@ -0,0 +1,30 @@
+"""Added bot settings table
+
+Revision ID: 7a2e4b91c0d3
+Revises: 3f1b7c2d9a64
+Create Date: 2026-10-17 11:03:27.540118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a2e4b91c0d3'
+down_revision: Union[str, None] = '3f1b7c2d9a64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('bot_settings',
+                    sa.Column('key', sa.String(), nullable=False),
+                    sa.Column('value', sa.String(), nullable=False),
+                    sa.PrimaryKeyConstraint('key')
+                    )
+
+
+def downgrade() -> None:
+    op.drop_table('bot_settings')
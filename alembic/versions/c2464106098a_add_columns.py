@@ -1,7 +1,7 @@
 """add columns
 
 Revision ID: c2464106098a
-Revises: 
+Revises: 0b8d5e3f7a21
 Create Date: 2024-03-01 06:46:11.715510
 
 """
@@ -13,7 +13,7 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision: str = 'c2464106098a'
-down_revision: Union[str, None] = None
+down_revision: Union[str, None] = '0b8d5e3f7a21'
 branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
@@ -0,0 +1,34 @@
+"""Added user subscriptions indexes
+
+Revision ID: d41c7e9b2f58
+Revises: 7a2e4b91c0d3
+Create Date: 2026-10-17 14:21:05.318902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41c7e9b2f58'
+down_revision: Union[str, None] = '7a2e4b91c0d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY doesn't lock writes to the table while building, but can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index('ix_user_subscriptions_streamer_id', 'user_subscriptions', ['streamer_id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_user_subscriptions_guild_id_user_id', 'user_subscriptions', ['guild_id', 'user_id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_subscriptions_guild_id_user_id', table_name='user_subscriptions',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_user_subscriptions_streamer_id', table_name='user_subscriptions',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,133 @@
+"""Store ids as bigint
+
+Revision ID: e6f0a3c95b17
+Revises: d41c7e9b2f58
+Create Date: 2026-10-17 15:02:44.871230
+
+The id columns are converted without rewriting the tables under a long lock, since ALTER COLUMN TYPE would
+block the bot for as long as it takes to rewrite user_subscriptions:
+
+1. A BIGINT shadow column is added for every id column, and a trigger keeps it in sync with rows the running
+   bot writes in the meantime.
+2. Existing rows are backfilled in small batches, each in its own transaction.
+3. NOT NULL checks are validated and the new primary key, unique and plain indexes are built CONCURRENTLY.
+4. In one short transaction the old columns are dropped, the shadow columns take their names and the
+   prebuilt indexes are attached as constraints. Foreign keys are added NOT VALID.
+5. The foreign keys are validated without blocking writes.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6f0a3c95b17'
+down_revision: Union[str, None] = 'd41c7e9b2f58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Rows updated per backfill transaction
+BACKFILL_BATCH_SIZE = 5000
+
+ID_COLUMNS = {
+    'guilds': ['guild_id', 'notification_channel_id'],
+    'streamers': ['streamer_id'],
+    'user_subscriptions': ['user_id', 'guild_id', 'streamer_id'],
+    'notification_outbox': ['guild_id', 'channel_id'],
+}
+
+# Built on the shadow columns before the swap, then renamed to (or attached as) the existing name
+INDEXES = [
+    ('guilds', 'guilds_pkey', ['guild_id'], True),
+    ('streamers', 'streamers_pkey', ['streamer_id'], True),
+    ('user_subscriptions', 'uix_1', ['user_id', 'guild_id', 'streamer_id'], True),
+    ('user_subscriptions', 'ix_user_subscriptions_streamer_id', ['streamer_id'], False),
+    ('user_subscriptions', 'ix_user_subscriptions_guild_id_user_id', ['guild_id', 'user_id'], False),
+]
+
+FOREIGN_KEYS = [
+    ('user_subscriptions_guild_id_fkey', 'guild_id', 'guilds', 'ON DELETE CASCADE'),
+    ('user_subscriptions_streamer_id_fkey', 'streamer_id', 'streamers', ''),
+]
+
+
+def shadow(column: str) -> str:
+    return f'{column}_bigint'
+
+
+def upgrade() -> None:
+    for table, columns in ID_COLUMNS.items():
+        for column in columns:
+            op.add_column(table, sa.Column(shadow(column), sa.BigInteger(), nullable=True))
+        assignments = '; '.join(f'NEW.{shadow(c)} := NEW.{c}::bigint' for c in columns)
+        op.execute(f"""
+            CREATE FUNCTION {table}_sync_bigint_ids() RETURNS trigger AS $$
+            BEGIN {assignments}; RETURN NEW; END
+            $$ LANGUAGE plpgsql
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {table}_sync_bigint_ids BEFORE INSERT OR UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {table}_sync_bigint_ids()
+        """)
+
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        for table, columns in ID_COLUMNS.items():
+            assignments = ', '.join(f'{shadow(c)} = {c}::bigint' for c in columns)
+            while connection.execute(sa.text(f"""
+                UPDATE {table} SET {assignments}
+                WHERE ctid = ANY(ARRAY(SELECT ctid FROM {table} WHERE {shadow(columns[0])} IS NULL LIMIT :batch))
+            """), {'batch': BACKFILL_BATCH_SIZE}).rowcount:
+                pass
+
+            # A validated check lets SET NOT NULL skip scanning the table during the swap
+            for column in columns:
+                op.execute(f'ALTER TABLE {table} ADD CONSTRAINT {shadow(column)}_not_null '
+                           f'CHECK ({shadow(column)} IS NOT NULL) NOT VALID')
+                op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {shadow(column)}_not_null')
+
+        for table, name, columns, unique in INDEXES:
+            op.create_index(shadow(name), table, [shadow(c) for c in columns], unique=unique,
+                            postgresql_concurrently=True, if_not_exists=True)
+
+    op.execute(f'LOCK TABLE {", ".join(ID_COLUMNS)} IN ACCESS EXCLUSIVE MODE')
+    for name, _, _, _ in FOREIGN_KEYS:
+        op.drop_constraint(name, 'user_subscriptions', type_='foreignkey')
+    for table, columns in ID_COLUMNS.items():
+        op.execute(f'DROP TRIGGER {table}_sync_bigint_ids ON {table}')
+        op.execute(f'DROP FUNCTION {table}_sync_bigint_ids()')
+        for column in columns:
+            # Also drops the old primary key, unique constraint and indexes on the column
+            op.drop_column(table, column)
+            op.alter_column(table, shadow(column), new_column_name=column, nullable=False)
+            op.drop_constraint(f'{shadow(column)}_not_null', table, type_='check')
+
+    for table, name, _, unique in INDEXES:
+        if name.endswith('_pkey'):
+            op.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} PRIMARY KEY USING INDEX {shadow(name)}')
+        elif unique:
+            op.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {shadow(name)}')
+        else:
+            op.execute(f'ALTER INDEX {shadow(name)} RENAME TO {name}')
+    for name, column, referred_table, on_delete in FOREIGN_KEYS:
+        op.execute(f'ALTER TABLE user_subscriptions ADD CONSTRAINT {name} FOREIGN KEY ({column}) '
+                   f'REFERENCES {referred_table} ({column}) {on_delete} NOT VALID')
+
+    # Validating only takes a lock that lets the bot keep reading and writing
+    with op.get_context().autocommit_block():
+        for name, _, _, _ in FOREIGN_KEYS:
+            op.execute(f'ALTER TABLE user_subscriptions VALIDATE CONSTRAINT {name}')
+
+
+def downgrade() -> None:
+    for name, _, _, _ in FOREIGN_KEYS:
+        op.drop_constraint(name, 'user_subscriptions', type_='foreignkey')
+    for table, columns in ID_COLUMNS.items():
+        for column in columns:
+            op.alter_column(table, column, type_=sa.String(), existing_type=sa.BigInteger(),
+                            postgresql_using=f'{column}::varchar')
+    for name, column, referred_table, on_delete in FOREIGN_KEYS:
+        op.execute(f'ALTER TABLE user_subscriptions ADD CONSTRAINT {name} FOREIGN KEY ({column}) '
+                   f'REFERENCES {referred_table} ({column}) {on_delete}')
@@ -41,6 +41,57 @@ class EmbedCreationContext:
         return self._strategy.create_embed(data, author_name, author_icon_url, thumbnail_url, image_url)
 
 
+class EventEmbedCache:
+    """
+    Render cache for the notification embeds of a single stream online event, so that fanning out to many
+    guilds builds each distinct embed once instead of once per guild.
+
+    Parameters:
+    - context (EmbedCreationContext): Context holding the randomly selected embed strategy.
+    - sfw_context (EmbedCreationContext): Context holding the SFW embed strategy.
+    - data (StreamOnlineEvent): The event data for the streamer going online.
+    - author_name: The name of the embed author.
+    - author_icon_url: The icon URL of the embed author.
+
+    Methods:
+    - get_embed(): Returns the random strategy embed, built on first use.
+    - get_sfw_embed(thumbnail_url, image_url): Returns the SFW embed for a guild icon, built on first use per icon.
+    """
+
+    def __init__(self,
+                 context: EmbedCreationContext,
+                 sfw_context: EmbedCreationContext,
+                 data: StreamOnlineEvent,
+                 author_name,
+                 author_icon_url):
+        self._context = context
+        self._sfw_context = sfw_context
+        self._data = data
+        self._author_name = author_name
+        self._author_icon_url = author_icon_url
+        self._embed: Optional[discord.Embed] = None
+        self._sfw_embeds: dict[tuple, discord.Embed] = {}
+
+    def get_embed(self) -> discord.Embed:
+        if self._embed is None:
+            self._embed = self._context.create_embed(self._data, self._author_name, self._author_icon_url)
+        return self._embed
+
+    def get_sfw_embed(self, thumbnail_url, image_url) -> discord.Embed:
+        # SFW embeds only differ by the guild icon shown as thumbnail, the image is the
+        # broadcaster's profile picture which is the same for the whole event
+        key = (thumbnail_url, image_url)
+        if key not in self._sfw_embeds:
+            self._sfw_embeds[key] = self._sfw_context.create_embed_custom_images(
+                self._data,
+                self._author_name,
+                self._author_icon_url,
+                thumbnail_url,
+                image_url
+            )
+        return self._sfw_embeds[key]
+
+
 def create_config_embed(
         channel_name: str,
         channel_mode: str,
@@ -1,32 +1,42 @@
-from typing import Optional
+from typing import Callable, Optional, Union
 
 import discord
 from discord.ext import commands
 from discord.ext.commands import Context
 from twitchAPI.twitch import Twitch
 from twitchAPI.type import TwitchAPIException
-from sqlalchemy import select, Engine
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from bot.models import Guild, GetUsersStreamer
+from bot.subscription_index import GuildConfig
 
 
-def is_owner_or_optin_mode(engine: Engine):
+def is_owner_or_optin_mode(engine: Union[AsyncEngine, Callable[[], AsyncEngine]],
+                           guild_configs: Optional[Callable[[int], Optional[GuildConfig]]] = None):
     """
     Check if the author of a command is the owner of the guild or if the guild's notification mode is 'optin'.
     Used as a decorator for checking permissions of command handlers
 
     Parameters:
-    - engine (Engine): The SQLAlchemy engine to use for database operations.
+    - engine (Union[AsyncEngine, Callable[[], AsyncEngine]]): The SQLAlchemy async engine to use for database operations,
+      or a function returning it so the check can be declared before the engine is created.
+    - guild_configs (Optional[Callable[[int], Optional[GuildConfig]]]): Returns the cached configuration of a guild,
+      the database is only queried for guilds it does not know.
     - ctx (Context): The context of the command being invoked.
 
     Returns:
     - bool: True if the author is the guild owner or the guild's notification mode is 'optin', False otherwise.
     """
-    def predicate(ctx: Context) -> bool:
-        with Session(engine) as session:
-            guild_notif_mode = session.scalar(
-                select(Guild.notification_mode).where(Guild.guild_id == str(ctx.guild.id)))
-            return guild_notif_mode.lower() == 'optin' or ctx.author.id == ctx.guild.owner.id
+    async def predicate(ctx: Context) -> bool:
+        if ctx.author.id == ctx.guild.owner_id:
+            return True
+        guild_config = guild_configs(ctx.guild.id) if guild_configs else None
+        if guild_config is not None:
+            return guild_config.notification_mode.lower() == 'optin'
+        async with AsyncSession(engine if isinstance(engine, AsyncEngine) else engine()) as session:
+            guild_notif_mode = await session.scalar(
+                select(Guild.notification_mode).where(Guild.guild_id == ctx.guild.id))
+            return guild_notif_mode.lower() == 'optin'
     return commands.check(predicate)
 
 
@@ -42,13 +52,46 @@ def is_owner(interaction: discord.Interaction) -> bool:
     - bool: True if the author of the interaction is the guild owner, False otherwise.
     """
 
-    if interaction.guild is None or interaction.user is None or interaction.guild.owner is None:
+    if interaction.guild is None or interaction.user is None or interaction.guild.owner_id is None:
         return False
-    user_is_owner = interaction.user.id == interaction.guild.owner.id
+    user_is_owner = interaction.user.id == interaction.guild.owner_id
     print(f'Command Level is owner check: {user_is_owner}')
     return user_is_owner
 
 
+def minimal_intents() -> discord.Intents:
+    """
+    Returns the gateway intents the bot needs: guilds and their channels, and guild messages with their content
+    for the prefix commands. Members and presences are left out, so they are neither sent nor cached.
+
+    Parameters:
+    - None
+
+    Returns:
+    - discord.Intents: The intents to connect with.
+    """
+
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.message_content = True
+    return intents
+
+
+async def get_guild_owner(guild: discord.Guild) -> discord.Member:
+    """
+    Returns the owner of a guild, fetching it from Discord if it is not cached (members are not cached).
+
+    Parameters:
+    - guild (discord.Guild): The guild whose owner to get.
+
+    Returns:
+    - discord.Member: The owner of the guild.
+    """
+
+    return guild.owner or await guild.fetch_member(guild.owner_id)
+
+
 def get_first_sendable_text_channel(guild: discord.Guild) -> Optional[discord.TextChannel]:
     """
     Returns the first text channel in the guild that the bot has permission to send messages to.
@@ -76,7 +119,7 @@ async def streamer_get_ids_names_from_logins(twitch: Twitch, broadcaster_logins:
     """
 
     try:
-        return [GetUsersStreamer(user.id, user.display_name) async for user in twitch.get_users(logins=broadcaster_logins)]
+        return [GetUsersStreamer(int(user.id), user.display_name) async for user in twitch.get_users(logins=broadcaster_logins)]
     except TwitchAPIException as e:
         print(e)
         return []
@@ -95,7 +138,7 @@ async def validate_streamer_ids_get_names(twitch: Twitch, ids: list[str]) -> lis
     """
 
     try:
-        return [GetUsersStreamer(user.id, user.display_name) async for user in twitch.get_users(user_ids=ids)]
+        return [GetUsersStreamer(int(user.id), user.display_name) async for user in twitch.get_users(user_ids=ids)]
     except TwitchAPIException as e:
         print(e)
         return []
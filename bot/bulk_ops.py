@@ -0,0 +1,149 @@
+from typing import Iterable, Optional
+
+from sqlalchemy import BigInteger, String, column, delete, select, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.models import Streamer, UserSubscription
+
+# Rows per UPDATE ... FROM (VALUES ...) statement, two bind parameters each, well under Postgres' 65535 limit
+BULK_UPDATE_CHUNK_SIZE = 1000
+
+
+def chunked(items: list, size: int) -> Iterable[list]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def bulk_update_topic_sub_ids(session: AsyncSession,
+                                    topic_sub_ids: dict[int, str],
+                                    chunk_size: int = BULK_UPDATE_CHUNK_SIZE) -> int:
+    """
+    Set the topic_sub_id of many streamers with one set-based statement per chunk,
+    UPDATE streamers SET ... FROM (VALUES ...), instead of one UPDATE per row. Does not commit.
+
+    Parameters:
+    - session (AsyncSession): The session the statements are executed in.
+    - topic_sub_ids (dict[int, str]): The new topic_sub_id of each streamer, keyed by streamer id.
+    - chunk_size (int): How many rows each statement updates.
+
+    Returns:
+    - int: The number of statements that were executed.
+    """
+
+    statements = 0
+    for chunk in chunked(list(topic_sub_ids.items()), chunk_size):
+        new_ids = values(column('streamer_id', BigInteger), column('topic_sub_id', String), name='new_ids').data(chunk)
+        await session.execute(
+            update(Streamer)
+            .where(Streamer.streamer_id == new_ids.c.streamer_id)
+            .values(topic_sub_id=new_ids.c.topic_sub_id)
+            .execution_options(synchronize_session=False)
+        )
+        statements += 1
+    return statements
+
+
+async def insert_streamers(session: AsyncSession, streamers: list[dict]) -> set[int]:
+    """
+    Insert streamers with one INSERT ... ON CONFLICT DO NOTHING RETURNING statement, skipping the ones
+    that are already tracked, for example because another command inserted them concurrently. Does not commit.
+
+    Parameters:
+    - session (AsyncSession): The session the statement is executed in.
+    - streamers (list[dict]): The streamer_id, streamer_name and topic_sub_id of every streamer to insert.
+
+    Returns:
+    - set[int]: The ids of the streamers that were inserted.
+    """
+
+    if not streamers:
+        return set()
+    result = await session.scalars(
+        insert(Streamer).values(streamers).on_conflict_do_nothing(index_elements=[Streamer.streamer_id])
+        .returning(Streamer.streamer_id)
+    )
+    return set(result.all())
+
+
+async def insert_user_subscriptions(session: AsyncSession, user_id: int, guild_id: int,
+                                    streamer_ids: Iterable[int]) -> set[int]:
+    """
+    Subscribe a user of a guild to streamers with one INSERT ... ON CONFLICT DO NOTHING RETURNING statement,
+    so existing subscriptions are skipped instead of failing the whole batch. Does not commit.
+
+    Parameters:
+    - session (AsyncSession): The session the statement is executed in.
+    - user_id (int): The Discord id of the user.
+    - guild_id (int): The Discord id of the guild.
+    - streamer_ids (Iterable[int]): The ids of the streamers to subscribe to, which must already be tracked.
+
+    Returns:
+    - set[int]: The ids of the streamers the user was not subscribed to yet.
+    """
+
+    rows = [{'user_id': user_id, 'guild_id': guild_id, 'streamer_id': s} for s in streamer_ids]
+    if not rows:
+        return set()
+    result = await session.scalars(
+        insert(UserSubscription).values(rows).on_conflict_do_nothing(constraint='uix_1')
+        .returning(UserSubscription.streamer_id)
+    )
+    return set(result.all())
+
+
+async def delete_user_subscriptions(session: AsyncSession, user_id: int, guild_id: int,
+                                    streamer_ids: Optional[Iterable[int]] = None) -> dict[int, str]:
+    """
+    Unsubscribe a user of a guild from streamers with one DELETE ... RETURNING statement. Does not commit.
+
+    Parameters:
+    - session (AsyncSession): The session the statement is executed in.
+    - user_id (int): The Discord id of the user.
+    - guild_id (int): The Discord id of the guild.
+    - streamer_ids (Optional[Iterable[int]]): The ids of the streamers to unsubscribe from, every streamer if None.
+
+    Returns:
+    - dict[int, str]: The name of every streamer the user was unsubscribed from, keyed by streamer id.
+    """
+
+    # A Core delete, since ORM deletes can't return columns of the joined streamers table
+    stmt = delete(UserSubscription.__table__).where(
+        UserSubscription.user_id == user_id,
+        UserSubscription.guild_id == guild_id,
+        UserSubscription.streamer_id == Streamer.streamer_id
+    )
+    if streamer_ids is not None:
+        streamer_ids = list(streamer_ids)
+        if not streamer_ids:
+            return {}
+        stmt = stmt.where(UserSubscription.streamer_id.in_(streamer_ids))
+    result = await session.execute(stmt.returning(UserSubscription.streamer_id, Streamer.streamer_name))
+    return dict(result.all())
+
+
+async def delete_orphaned_streamers(session: AsyncSession,
+                                    streamer_ids: Optional[Iterable[int]] = None) -> dict[int, str]:
+    """
+    Stop tracking the streamers that nobody is subscribed to anymore, with one anti-join
+    DELETE ... WHERE NOT EXISTS ... RETURNING statement. Does not commit.
+
+    Parameters:
+    - session (AsyncSession): The session the statement is executed in.
+    - streamer_ids (Optional[Iterable[int]]): The ids of the streamers that may have lost their last subscription,
+      every streamer is checked if None.
+
+    Returns:
+    - dict[int, str]: The topic_sub_id of every deleted streamer, keyed by streamer id.
+    """
+
+    stmt = delete(Streamer).where(
+        ~select(UserSubscription.id).where(UserSubscription.streamer_id == Streamer.streamer_id).exists()
+    )
+    if streamer_ids is not None:
+        streamer_ids = list(streamer_ids)
+        if not streamer_ids:
+            return {}
+        stmt = stmt.where(Streamer.streamer_id.in_(streamer_ids))
+    result = await session.execute(stmt.returning(Streamer.streamer_id, Streamer.topic_sub_id))
+    return dict(result.all())
@@ -0,0 +1,57 @@
+import hashlib
+import json
+
+from discord import app_commands
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from bot.models import BotSetting
+
+COMMAND_TREE_FINGERPRINT_KEY = 'command_tree_fingerprint'
+
+
+def command_tree_fingerprint(tree: app_commands.CommandTree) -> str:
+    """
+    Hash the global application commands of a command tree as Discord would receive them on sync
+    (names, descriptions, parameters, permissions...), so that any change to the tree changes the hash.
+
+    Parameters:
+    - tree (app_commands.CommandTree): The command tree of the bot.
+
+    Returns:
+    - str: The hex SHA-256 of the commands' sync payload.
+    """
+
+    payload = sorted((command.to_dict() for command in tree.get_commands()), key=lambda c: (c['name'], c['type']))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+async def sync_command_tree(tree: app_commands.CommandTree, engine: AsyncEngine, force: bool = False) -> bool:
+    """
+    Sync the global application commands with Discord only if they changed since the last sync.
+    The fingerprint of the last synced tree is kept in the bot_settings table.
+
+    Parameters:
+    - tree (app_commands.CommandTree): The command tree of the bot.
+    - engine (AsyncEngine): The engine used to read and store the fingerprint.
+    - force (bool): Sync even if the fingerprint did not change.
+
+    Returns:
+    - bool: True if the tree was synced, False if the sync was skipped.
+    """
+
+    fingerprint = command_tree_fingerprint(tree)
+    async with AsyncSession(engine) as session:
+        stored = await session.scalar(
+            select(BotSetting.value).where(BotSetting.key == COMMAND_TREE_FINGERPRINT_KEY))
+    if stored == fingerprint and not force:
+        return False
+
+    await tree.sync()
+    async with AsyncSession(engine) as session:
+        stmt = pg_insert(BotSetting).values(key=COMMAND_TREE_FINGERPRINT_KEY, value=fingerprint)
+        await session.execute(stmt.on_conflict_do_update(index_elements=[BotSetting.key],
+                                                         set_={'value': stmt.excluded.value}))
+        await session.commit()
+    return True
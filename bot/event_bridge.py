@@ -0,0 +1,170 @@
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Optional
+
+Job = Callable[[], Awaitable[None]]
+
+
+@dataclass
+class BridgeMetrics:
+    """
+    Snapshot of the state of an EventBridge.
+
+    Attributes:
+    - depth (int): How many jobs are waiting in the queue.
+    - max_depth (int): The deepest the queue has been.
+    - capacity (int): The size of the queue.
+    - submitted (int): How many jobs were queued in total.
+    - completed (int): How many jobs finished without raising.
+    - failed (int): How many jobs raised.
+    - last_wait (float): How long the last started job waited in the queue, in seconds.
+    - max_wait (float): The longest any job waited in the queue, in seconds.
+    - total_wait (float): The summed wait of every started job, in seconds.
+    """
+    depth: int
+    max_depth: int
+    capacity: int
+    submitted: int
+    completed: int
+    failed: int
+    last_wait: float
+    max_wait: float
+    total_wait: float
+
+    @property
+    def average_wait(self) -> float:
+        started = self.completed + self.failed
+        return self.total_wait / started if started else 0.0
+
+    def to_dict(self) -> dict:
+        data = {key: round(value, 3) if isinstance(value, float) else value for key, value in asdict(self).items()}
+        data['average_wait'] = round(self.average_wait, 3)
+        return data
+
+    def summary(self) -> str:
+        return (f'Event queue: {self.depth}/{self.capacity} waiting (max {self.max_depth}), '
+                f'{self.completed} done, {self.failed} failed, waited {self.last_wait:.2f}s last, '
+                f'{self.average_wait:.2f}s on average, {self.max_wait:.2f}s at most')
+
+
+class EventBridge:
+    """
+    Bounded FIFO queue that carries work from the EventSub webhook's loop (its own thread) over to the
+    bot's loop, where a fixed number of workers pick jobs up in the order they were submitted. When the queue
+    is full, submitters wait for room instead of piling up unbounded work on the bot's loop. A warning is
+    printed once the queue fills past the high-water mark, and again only after it has drained below half of it.
+    While jobs are flowing, a summary of the queue depth and wait times is printed every `log_interval` seconds.
+
+    Parameters:
+    - maxsize (int): How many jobs can wait in the queue.
+    - workers (int): How many jobs run at the same time.
+    - high_water_mark (float): Fraction of maxsize at which a backlog warning is printed.
+    - log_interval (float): Seconds between two printed summaries of the metrics.
+    - clock (Callable[[], float]): Monotonic clock used for wait times, overridable for testing.
+
+    Methods:
+    - start(): Creates the queue and workers on the running (bot) loop.
+    - submit(job): Queues a job from any loop, waiting for room if the queue is full.
+    - metrics(): Returns a snapshot of the queue depth, throughput and wait times.
+    - stop(): Cancels the workers.
+    """
+
+    def __init__(self, maxsize: int = 1000, workers: int = 4, high_water_mark: float = 0.8,
+                 log_interval: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.high_water_mark = high_water_mark
+        self.log_interval = log_interval
+        self._clock = clock
+        self._last_log = clock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._above_high_water = False
+        self._max_depth = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._last_wait = 0.0
+        self._max_wait = 0.0
+        self._total_wait = 0.0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [self._loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, job: Job):
+        """
+        Queue a job to run on the bot's loop. Safe to call from any loop, waits while the queue is full.
+
+        Parameters:
+        - job (Job): Coroutine function to run, called without arguments.
+
+        Returns:
+        - None
+        """
+
+        if self._loop is None:
+            raise RuntimeError('EventBridge has not been started')
+        if asyncio.get_running_loop() is self._loop:
+            await self._put(job)
+        else:
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._put(job), self._loop))
+
+    async def _put(self, job: Job):
+        await self._queue.put((self._clock(), job))
+        self._submitted += 1
+        depth = self._queue.qsize()
+        self._max_depth = max(self._max_depth, depth)
+        if not self._above_high_water and depth >= self.maxsize * self.high_water_mark:
+            self._above_high_water = True
+            print(f'Event queue above high-water mark: {depth}/{self.maxsize} jobs waiting')
+
+    async def _work(self):
+        while True:
+            queued_at, job = await self._queue.get()
+            wait = self._clock() - queued_at
+            self._last_wait = wait
+            self._max_wait = max(self._max_wait, wait)
+            self._total_wait += wait
+            if self._above_high_water and self._queue.qsize() < self.maxsize * self.high_water_mark / 2:
+                self._above_high_water = False
+                print(f'Event queue back below high-water mark after waiting up to {self._max_wait:.2f}s')
+            try:
+                await job()
+                self._completed += 1
+            except Exception as e:
+                self._failed += 1
+                print(f'Event job failed: {e}')
+            finally:
+                if self._clock() - self._last_log >= self.log_interval:
+                    self._last_log = self._clock()
+                    print(self.metrics().summary())
+                self._queue.task_done()
+
+    def metrics(self) -> BridgeMetrics:
+        return BridgeMetrics(
+            depth=self._queue.qsize() if self._queue else 0,
+            max_depth=self._max_depth,
+            capacity=self.maxsize,
+            submitted=self._submitted,
+            completed=self._completed,
+            failed=self._failed,
+            last_wait=self._last_wait,
+            max_wait=self._max_wait,
+            total_wait=self._total_wait
+        )
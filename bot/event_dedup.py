@@ -0,0 +1,106 @@
+import contextvars
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+# Message id of the delivery being handled. EventSubWebhook appends the id and creates the callback's task in the
+# same step, so the task's copy of the context carries the id of the message it was created for
+_delivered_message_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('delivered_message_id',
+                                                                                      default=None)
+
+
+class TTLCache:
+    """
+    Set of recently seen keys that forgets a key once it is older than `ttl`, and the least recently
+    seen keys first once it holds `max_size` of them.
+
+    Parameters:
+    - max_size (int): The maximum number of keys kept.
+    - ttl (float): How long, in seconds, a key is remembered.
+    - clock (Callable[[], float]): Monotonic clock used for expiry, overridable for testing.
+
+    Methods:
+    - add(key): Remembers a key, refreshing it if it was already known.
+    - check_and_add(key): Remembers a key and returns whether it was already known.
+    - discard(key): Forgets a key, if it is known.
+    """
+
+    def __init__(self, max_size: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._expiry: OrderedDict[Hashable, float] = OrderedDict()
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def __contains__(self, key: Hashable) -> bool:
+        expires_at = self._expiry.get(key)
+        if expires_at is None:
+            return False
+        if expires_at <= self._clock():
+            del self._expiry[key]
+            return False
+        return True
+
+    def add(self, key: Hashable):
+        self._expiry[key] = self._clock() + self.ttl
+        self._expiry.move_to_end(key)
+        # Keys are kept in insertion order, so expired ones and the least recently seen are at the front
+        now = self._clock()
+        while self._expiry and (len(self._expiry) > self.max_size or next(iter(self._expiry.values())) <= now):
+            self._expiry.popitem(last=False)
+
+    def check_and_add(self, key: Hashable) -> bool:
+        seen = key in self
+        self.add(key)
+        return seen
+
+    def discard(self, key: Hashable):
+        self._expiry.pop(key, None)
+
+
+class EventDeduplicator:
+    """
+    Drops EventSub redeliveries before any database or Discord work is done. Twitch may send the same
+    notification more than once (same message id), and a resubscribe can replay a go-live under a new message
+    id, which is caught by the broadcaster id and stream start time instead.
+
+    It doubles as the message id history of EventSubWebhook (which only needs `in` and `append`), so the
+    webhook drops a duplicate message id before it even parses the event. Both checks run on the webhook's
+    own event loop, so no locking is needed.
+
+    Parameters:
+    - max_size (int): The maximum number of message ids and events remembered.
+    - ttl (float): How long, in seconds, a message id or event is remembered.
+    - clock (Callable[[], float]): Monotonic clock used for expiry, overridable for testing.
+
+    Methods:
+    - is_duplicate_message(message_id): Records a message id and returns whether it was seen before.
+    - is_duplicate_event(broadcaster_id, started_at): Records a go-live and returns whether it was seen before.
+    - forget_event(broadcaster_id, started_at): Forgets a go-live and the message id it was delivered with, so
+      that a redelivery is handled again after the event could not be processed.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600, clock: Callable[[], float] = time.monotonic):
+        self.message_ids = TTLCache(max_size, ttl, clock)
+        self.events = TTLCache(max_size, ttl, clock)
+
+    def __contains__(self, message_id: str) -> bool:
+        return message_id in self.message_ids
+
+    def append(self, message_id: str):
+        self.message_ids.add(message_id)
+        _delivered_message_id.set(message_id)
+
+    def is_duplicate_message(self, message_id: str) -> bool:
+        return self.message_ids.check_and_add(message_id)
+
+    def is_duplicate_event(self, broadcaster_id: str, started_at) -> bool:
+        return self.events.check_and_add((str(broadcaster_id), str(started_at)))
+
+    def forget_event(self, broadcaster_id: str, started_at):
+        self.events.discard((str(broadcaster_id), str(started_at)))
+        message_id = _delivered_message_id.get()
+        if message_id is not None:
+            self.message_ids.discard(message_id)
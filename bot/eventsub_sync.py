@@ -0,0 +1,228 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable, Optional
+
+from twitchAPI.eventsub.webhook import EventSubWebhook
+from twitchAPI.object.api import EventSubSubscription
+from twitchAPI.object.eventsub import StreamOnlineEvent
+from twitchAPI.twitch import Twitch
+from twitchAPI.type import TwitchAPIException
+
+
+@dataclass
+class ResubscribeReport:
+    """
+    Outcome of subscribing a set of streamers to stream.online.
+
+    Attributes:
+    - subscribed (dict[int, str]): The new topic_sub_id of every streamer that was subscribed, keyed by streamer id.
+    - failed (dict[int, Exception]): The error of every streamer that could not be subscribed, keyed by streamer id.
+    """
+    subscribed: dict[int, str] = field(default_factory=dict)
+    failed: dict[int, Exception] = field(default_factory=dict)
+
+
+async def resubscribe_streamers(webhook: EventSubWebhook,
+                                streamer_ids: Iterable[int],
+                                callback: Callable[[StreamOnlineEvent], Awaitable[None]],
+                                concurrency: int = 10,
+                                progress_every: int = 100) -> ResubscribeReport:
+    """
+    Subscribe streamers to stream.online with at most `concurrency` Twitch API calls in flight.
+    A streamer that fails is recorded in the report and does not stop the others.
+
+    Parameters:
+    - webhook (EventSubWebhook): The webhook the subscriptions are created on.
+    - streamer_ids (Iterable[int]): The ids of the streamers to subscribe.
+    - callback (Callable[[StreamOnlineEvent], Awaitable[None]]): Called when one of the streamers goes live.
+    - concurrency (int): The maximum number of subscriptions being created at the same time.
+    - progress_every (int): Print progress every this many streamers.
+
+    Returns:
+    - ResubscribeReport: The topic_sub_id of every subscribed streamer and the error of every failed one.
+    """
+
+    streamer_ids = list(streamer_ids)
+    report = ResubscribeReport()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def subscribe(streamer_id: int):
+        async with semaphore:
+            try:
+                report.subscribed[streamer_id] = await webhook.listen_stream_online(str(streamer_id), callback)
+            except Exception as e:
+                report.failed[streamer_id] = e
+                print(f'Failed to subscribe to streamer {streamer_id}: {e}')
+            done = len(report.subscribed) + len(report.failed)
+            if done % progress_every == 0 and done < len(streamer_ids):
+                print(f'Subscribed {done}/{len(streamer_ids)} streamers...')
+
+    await asyncio.gather(*(subscribe(s) for s in streamer_ids))
+    return report
+
+
+async def unsubscribe_topics(webhook: EventSubWebhook,
+                             topic_sub_ids: dict[int, str],
+                             concurrency: int = 10) -> list[int]:
+    """
+    Delete the EventSub subscriptions of streamers that are no longer tracked, with at most `concurrency`
+    Twitch API calls in flight. A subscription that can't be deleted is reported and does not stop the others.
+
+    Parameters:
+    - webhook (EventSubWebhook): The webhook the subscriptions were created on.
+    - topic_sub_ids (dict[int, str]): The topic_sub_id of every streamer to unsubscribe, keyed by streamer id.
+    - concurrency (int): The maximum number of subscriptions being deleted at the same time.
+
+    Returns:
+    - list[int]: The ids of the streamers whose subscription could not be deleted.
+    """
+
+    failed = []
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def unsubscribe(streamer_id: int, topic_sub_id: str):
+        async with semaphore:
+            print(f'unsubbing topic {topic_sub_id} from streamer {streamer_id}')
+            try:
+                if await webhook.unsubscribe_topic(topic_sub_id):
+                    return
+                error = 'the API did not confirm it'
+            except Exception as e:
+                error = e
+            failed.append(streamer_id)
+            print(f'Failed to unsubscribe from streamer {streamer_id}: {error}')
+
+    await asyncio.gather(*(unsubscribe(s, topic) for s, topic in topic_sub_ids.items()))
+    return failed
+
+
+@dataclass
+class SubscriptionPlan:
+    """
+    Difference between the stream.online subscriptions Twitch has for us and the streamers we track.
+
+    Attributes:
+    - kept (dict[int, str]): Healthy subscriptions that are reused, subscription id keyed by streamer id.
+    - orphaned (list[str]): Ids of subscriptions to delete, because nobody tracks the streamer anymore,
+      they are duplicates or they were revoked or failed.
+    - missing (list[int]): Ids of tracked streamers without a healthy subscription.
+    """
+    kept: dict[int, str] = field(default_factory=dict)
+    orphaned: list[str] = field(default_factory=list)
+    missing: list[int] = field(default_factory=list)
+
+
+@dataclass
+class ReconcileReport:
+    """
+    Outcome of applying a SubscriptionPlan.
+
+    Attributes:
+    - topic_sub_ids (dict[int, str]): Every streamer whose topic_sub_id must be updated in the DB, with the new id.
+    - deleted (list[str]): Ids of the orphaned subscriptions that were deleted.
+    - failed (dict[int, Exception]): Errors of the streamers that could not be subscribed, keyed by streamer id.
+    """
+    topic_sub_ids: dict[int, str] = field(default_factory=dict)
+    deleted: list[str] = field(default_factory=list)
+    failed: dict[int, Exception] = field(default_factory=dict)
+
+
+def adopt_subscription(webhook: EventSubWebhook,
+                       sub: EventSubSubscription,
+                       callback: Callable[[StreamOnlineEvent], Awaitable[None]]) -> bool:
+    """
+    Register an existing stream.online subscription on the webhook, so that its events are handled without
+    subscribing again. twitchAPI has no public API for this: this is the only place that uses its private
+    attributes (_get_transport, _add_callback and _callbacks of twitchAPI 4.2.0, the version pinned in
+    requirements.txt), check it when upgrading twitchAPI.
+
+    Parameters:
+    - webhook (EventSubWebhook): The webhook the subscription is registered on.
+    - sub (EventSubSubscription): The subscription as listed by Helix.
+    - callback (Callable[[StreamOnlineEvent], Awaitable[None]]): Called when the streamer goes live.
+
+    Returns:
+    - bool: Whether the subscription was registered, False if it doesn't point at this webhook's callback.
+    """
+
+    if sub.transport.get('callback') != webhook._get_transport()['callback']:
+        return False
+    webhook._add_callback(sub.id, callback, StreamOnlineEvent)
+    webhook._callbacks[sub.id]['active'] = True
+    return True
+
+
+async def plan_subscriptions(twitch: Twitch,
+                             webhook: EventSubWebhook,
+                             tracked: dict[int, Optional[str]],
+                             callback: Callable[[StreamOnlineEvent], Awaitable[None]]) -> SubscriptionPlan:
+    """
+    Compare the stream.online subscriptions listed by Helix with the tracked streamers, and register the
+    healthy ones on the webhook so that their events are handled without subscribing again. Only subscriptions
+    pointing at this webhook's callback are reused, which only works if the webhook keeps the secret that was
+    used to create them.
+
+    Parameters:
+    - twitch (Twitch): An instance of the Twitch class used to list the subscriptions.
+    - webhook (EventSubWebhook): The webhook the subscriptions are registered on.
+    - tracked (dict[int, Optional[str]]): The topic_sub_id stored for every tracked streamer, keyed by streamer id.
+    - callback (Callable[[StreamOnlineEvent], Awaitable[None]]): Called when one of the streamers goes live.
+
+    Returns:
+    - SubscriptionPlan: The subscriptions to keep and delete and the streamers to subscribe.
+    """
+
+    plan = SubscriptionPlan()
+    async for sub in await twitch.get_eventsub_subscriptions(sub_type='stream.online'):
+        broadcaster_user_id = sub.condition.get('broadcaster_user_id')
+        streamer_id = int(broadcaster_user_id) if broadcaster_user_id else None
+        if sub.status == 'enabled' and streamer_id in tracked and streamer_id not in plan.kept \
+                and adopt_subscription(webhook, sub, callback):
+            plan.kept[streamer_id] = sub.id
+        else:
+            plan.orphaned.append(sub.id)
+
+    plan.missing = [streamer_id for streamer_id in tracked if streamer_id not in plan.kept]
+    return plan
+
+
+async def apply_subscription_plan(twitch: Twitch,
+                                  webhook: EventSubWebhook,
+                                  plan: SubscriptionPlan,
+                                  tracked: dict[int, Optional[str]],
+                                  callback: Callable[[StreamOnlineEvent], Awaitable[None]],
+                                  concurrency: int = 10) -> ReconcileReport:
+    """
+    Delete the orphaned subscriptions of a plan and subscribe the missing streamers, with at most
+    `concurrency` Twitch API calls in flight. The webhook must be running to confirm new subscriptions.
+
+    Parameters:
+    - twitch (Twitch): An instance of the Twitch class used to delete subscriptions.
+    - webhook (EventSubWebhook): The webhook new subscriptions are created on.
+    - plan (SubscriptionPlan): The plan returned by plan_subscriptions.
+    - tracked (dict[int, Optional[str]]): The topic_sub_id stored for every tracked streamer, keyed by streamer id.
+    - callback (Callable[[StreamOnlineEvent], Awaitable[None]]): Called when one of the streamers goes live.
+    - concurrency (int): The maximum number of Twitch API calls at the same time.
+
+    Returns:
+    - ReconcileReport: The topic_sub_ids to store, the deleted subscriptions and the streamers that failed.
+    """
+
+    report = ReconcileReport()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def delete(sub_id: str):
+        async with semaphore:
+            try:
+                await twitch.delete_eventsub_subscription(sub_id)
+                report.deleted.append(sub_id)
+            except TwitchAPIException as e:
+                print(f'Failed to delete EventSub subscription {sub_id}: {e}')
+
+    await asyncio.gather(*(delete(sub_id) for sub_id in plan.orphaned))
+    created = await resubscribe_streamers(webhook, plan.missing, callback, concurrency)
+
+    report.topic_sub_ids = {s: sub_id for s, sub_id in plan.kept.items() if tracked.get(s) != sub_id}
+    report.topic_sub_ids.update(created.subscribed)
+    report.failed = created.failed
+    return report
@@ -0,0 +1,89 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Optional
+
+import discord
+
+from bot.send_scheduler import SendScheduler
+
+
+@dataclass
+class GuildDelivery:
+    """
+    All of the messages a single guild should receive for one notification, in the order they must be sent.
+
+    Attributes:
+    - guild_id (int): The ID of the guild being notified.
+    - channel (discord.abc.Messageable): The channel the messages are sent to.
+    - messages (list[dict]): Keyword arguments for each channel.send call, sent one after the other.
+    """
+    guild_id: int
+    channel: discord.abc.Messageable
+    messages: list[dict] = field(default_factory=list)
+
+
+@dataclass
+class DeliveryResult:
+    """
+    Outcome of delivering a GuildDelivery.
+
+    Attributes:
+    - guild_id (int): The ID of the guild that was notified.
+    - success (bool): True if every message was sent.
+    - sent (int): How many messages were sent before finishing or failing.
+    - error (Optional[Exception]): The exception that stopped the delivery, if any.
+    """
+    guild_id: int
+    success: bool
+    sent: int = 0
+    error: Optional[Exception] = None
+
+
+async def deliver(delivery: GuildDelivery, scheduler: Optional[SendScheduler] = None) -> DeliveryResult:
+    """
+    Send the messages of a single guild delivery in order, stopping at the first failure.
+
+    Parameters:
+    - delivery (GuildDelivery): The delivery to send.
+    - scheduler (Optional[SendScheduler]): Paces the sends against Discord's rate limits, if given.
+
+    Returns:
+    - DeliveryResult: The outcome of the delivery. Exceptions are captured, never raised.
+    """
+
+    sent = 0
+    try:
+        for message in delivery.messages:
+            if scheduler:
+                await scheduler.send(delivery.channel, **message)
+            else:
+                await delivery.channel.send(**message)
+            sent += 1
+    except Exception as e:
+        return DeliveryResult(delivery.guild_id, False, sent, e)
+    return DeliveryResult(delivery.guild_id, True, sent)
+
+
+async def fan_out(deliveries: list[GuildDelivery],
+                  concurrency: int,
+                  scheduler: Optional[SendScheduler] = None) -> list[DeliveryResult]:
+    """
+    Deliver notifications to many guilds at once, with at most `concurrency` guilds in flight.
+    Messages within a guild keep their order, while a slow or broken channel only holds up its own guild.
+
+    Parameters:
+    - deliveries (list[GuildDelivery]): The deliveries to send.
+    - concurrency (int): The maximum number of guilds being sent to at the same time.
+    - scheduler (Optional[SendScheduler]): Paces the sends against Discord's rate limits, if given.
+
+    Returns:
+    - list[DeliveryResult]: One result per delivery, in the same order as the given deliveries.
+    """
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded_deliver(delivery: GuildDelivery) -> DeliveryResult:
+        async with semaphore:
+            return await deliver(delivery, scheduler)
+
+    return list(await asyncio.gather(*(bounded_deliver(d) for d in deliveries)))
@@ -0,0 +1,120 @@
+import time
+from typing import Callable, Iterable, Optional
+
+from aiohttp import web
+from twitchAPI.eventsub.webhook import EventSubWebhook
+
+STARTUP_STAGES = (
+    'db_ready',
+    'twitch_auth',
+    'webhook_listening',
+    'subscriptions_reconciled',
+    'commands_synced',
+    'discord_connected'
+)
+
+
+class StartupTracker:
+    """
+    Records the startup of the bot as an ordered list of stages. Each stage is marked once it is done, and
+    its duration is the time since the previous stage was marked, so slow cold starts can be traced to a stage.
+    The bot is ready once every stage is done.
+
+    Parameters:
+    - stages (Iterable[str]): The names of the stages, in the order they complete.
+    - clock (Callable[[], float]): Monotonic clock used for the timings, overridable for testing.
+
+    Methods:
+    - mark(stage): Records that a stage is done and prints how long it took.
+    - pending(): Returns the stages that are not done yet.
+    - snapshot(): Returns the readiness, the timing of every finished stage and the pending stages.
+    """
+
+    def __init__(self, stages: Iterable[str] = STARTUP_STAGES, clock: Callable[[], float] = time.monotonic):
+        self.stages = tuple(stages)
+        self._clock = clock
+        self.started_at = clock()
+        self._last_mark = self.started_at
+        self.timings: dict[str, float] = {}
+
+    @property
+    def ready(self) -> bool:
+        return len(self.timings) == len(self.stages)
+
+    @property
+    def uptime(self) -> float:
+        return self._clock() - self.started_at
+
+    def mark(self, stage: str):
+        if stage not in self.stages:
+            raise ValueError(f'Unknown startup stage: {stage}')
+        if stage in self.timings:
+            return
+        now = self._clock()
+        self.timings[stage] = now - self._last_mark
+        self._last_mark = now
+        print(f'Startup stage {stage} done in {self.timings[stage]:.2f}s ({now - self.started_at:.2f}s since start)')
+
+    def pending(self) -> list[str]:
+        return [stage for stage in self.stages if stage not in self.timings]
+
+    def snapshot(self) -> dict:
+        return {
+            'ready': self.ready,
+            'uptime': round(self.uptime, 3),
+            'stages': {stage: round(seconds, 3) for stage, seconds in self.timings.items()},
+            'pending': self.pending()
+        }
+
+
+def serve_health_checks(webhook: EventSubWebhook, startup: StartupTracker,
+                        alive: Optional[Callable[[], bool]] = None,
+                        metrics: Optional[Callable[[], dict]] = None):
+    """
+    Serve liveness and readiness endpoints on the webhook's aiohttp server, next to the EventSub callback.
+    Must be called before the webhook is started.
+
+    - GET /healthz answers 200 while the process is serving requests and `alive` holds, 503 otherwise.
+    - GET /readyz answers 200 once every startup stage is done, 503 with the pending stages until then.
+      The payload also carries the extra `metrics`, e.g. how far behind the event queue is.
+
+    Parameters:
+    - webhook (EventSubWebhook): The webhook whose server the endpoints are added to.
+    - startup (StartupTracker): The startup stages the readiness is read from.
+    - alive (Optional[Callable[[], bool]]): Extra liveness check, for example that the bot is not closed.
+    - metrics (Optional[Callable[[], dict]]): Extra JSON serializable metrics, keyed by name, added to /readyz.
+
+    Returns:
+    - None
+
+    Raises:
+    - RuntimeError: If the webhook has no private __build_runner method to wrap (twitchAPI was upgraded).
+    """
+
+    # EventSubWebhook builds its aiohttp app in a private method when started, which the routes are added to.
+    # It exists in twitchAPI 4.2.0 (pinned in requirements.txt): fail loudly if an upgrade renamed it, the
+    # endpoints would otherwise silently not be served and every machine would be marked unhealthy
+    if not hasattr(webhook, '_EventSubWebhook__build_runner'):
+        raise RuntimeError('EventSubWebhook has no __build_runner method to add the health check routes to, '
+                           'serve_health_checks does not support the installed twitchAPI version')
+
+    # The handlers run on the webhook's own loop and thread, so they only read state and never await the bot
+    async def healthz(request: web.Request) -> web.Response:
+        healthy = alive is None or alive()
+        return web.json_response({'alive': healthy, 'uptime': round(startup.uptime, 3)},
+                                 status=200 if healthy else 503)
+
+    async def readyz(request: web.Request) -> web.Response:
+        snapshot = startup.snapshot()
+        if metrics is not None:
+            snapshot.update(metrics())
+        return web.json_response(snapshot, status=200 if snapshot['ready'] else 503)
+
+    build_runner = webhook._EventSubWebhook__build_runner
+
+    def build_runner_with_health_checks() -> web.AppRunner:
+        runner = build_runner()
+        runner.app.add_routes([web.get('/healthz', healthz), web.get('/readyz', readyz)])
+        return runner
+
+    webhook._EventSubWebhook__build_runner = build_runner_with_health_checks
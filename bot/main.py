@@ -5,38 +5,67 @@ import random
 
 import discord
 from discord import app_commands
-from sqlalchemy import create_engine, select, delete, insert, update
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Session
+from sqlalchemy import select, delete, update
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from discord.ext import commands
 from twitchAPI.object.eventsub import StreamOnlineEvent, StreamOnlineData
 from twitchAPI.twitch import Twitch
-from twitchAPI.helper import first
 from dotenv import load_dotenv
 from twitchAPI.eventsub.webhook import EventSubWebhook
 
-from bot.bot_ui import ConfigView, create_config_embed, EmbedCreationContext
+from bot.bot_ui import ConfigView, create_config_embed, EmbedCreationContext, EventEmbedCache
 from bot.embed_strategies.draft import DraftEmbedStrategy
 from bot.embed_strategies.isis import IsisEmbedStrategy
-from bot.bot_utils import is_owner, get_first_sendable_text_channel, validate_streamer_ids_get_names, streamer_get_ids_names_from_logins, is_owner_or_optin_mode
+from bot.bulk_ops import bulk_update_topic_sub_ids, delete_orphaned_streamers, delete_user_subscriptions, \
+    insert_streamers, insert_user_subscriptions
+from bot.command_sync import sync_command_tree
+from bot.bot_utils import is_owner, get_first_sendable_text_channel, get_guild_owner, minimal_intents, validate_streamer_ids_get_names, streamer_get_ids_names_from_logins, is_owner_or_optin_mode
 from bot.embed_strategies.prigozhin import PrigozhinEmbedStrategy
 from bot.embed_strategies.sfw import SafeForWorkEmbedStrategy
-from bot.models import Base, Guild, UserSubscription, Streamer
+from bot.event_bridge import EventBridge
+from bot.event_dedup import EventDeduplicator
+from bot.eventsub_sync import resubscribe_streamers, plan_subscriptions, apply_subscription_plan, SubscriptionPlan, \
+    unsubscribe_topics
+from bot.health import StartupTracker, serve_health_checks
+from bot.fanout import GuildDelivery
+from bot.message_planner import plan_notification_messages
+from bot.outbox import NotificationOutbox
+from bot.profile_cache import BroadcasterProfileCache
+from bot.send_scheduler import SendScheduler
+from bot.subscription_index import GuildConfig, SubscriptionIndex
+from bot.models import Guild, UserSubscription, Streamer
 
 # Load dotenv if on local env (check for prod only env var)
 if not os.getenv('FLY_APP_NAME'):
     load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 client_secret = os.getenv('TWITCH_CLIENT_SECRET')
+# Stable EventSub secret, lets a restart keep the subscriptions of the previous run instead of recreating them all
+EVENTSUB_SECRET = os.getenv('EVENTSUB_SECRET')
 WEBHOOK_URL = os.getenv('WEBHOOK_URL')
 postgres_connection_str = os.getenv('POSTGRESQL_URL')
-
-intents = discord.Intents.all()
-bot = commands.Bot(command_prefix='!', intents=intents)
-
-# DB Init
-engine = create_engine(postgres_connection_str, echo=True, pool_pre_ping=True, pool_recycle=300)
-Base.metadata.create_all(engine)
+# Max number of guilds notified at the same time when a streamer goes live
+FANOUT_CONCURRENCY = int(os.getenv('FANOUT_CONCURRENCY', '25'))
+# How long a cached broadcaster profile (used for profile images) stays fresh, in seconds
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', '3600'))
+# Max number of Discord sends in flight, the scheduler shrinks it on 429s and slow responses
+SEND_CONCURRENCY = int(os.getenv('SEND_CONCURRENCY', '25'))
+# How long EventSub message ids and go-lives are remembered to drop redeliveries, in seconds
+EVENTSUB_DEDUP_TTL = int(os.getenv('EVENTSUB_DEDUP_TTL', '3600'))
+# Max number of go-lives waiting to be fanned out and how many are fanned out at the same time
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', '1000'))
+EVENT_WORKERS = int(os.getenv('EVENT_WORKERS', '4'))
+# Max number of EventSub subscriptions created at the same time on startup
+SUBSCRIBE_CONCURRENCY = int(os.getenv('SUBSCRIBE_CONCURRENCY', '10'))
+# Max number of messages kept in memory, the bot never reads old messages so it is kept small
+MESSAGE_CACHE_SIZE = int(os.getenv('MESSAGE_CACHE_SIZE', '100'))
+# How long delivered (or failed for good) notifications are kept in the outbox before they are purged, in seconds
+OUTBOX_RETENTION = int(os.getenv('OUTBOX_RETENTION', '604800'))
+
+# The bot and the engine are built on demand (see create_bot and get_engine), so importing this module
+# does not connect to anything. The schema is managed by Alembic (alembic upgrade head).
+bot: commands.Bot | None = None
+engine: AsyncEngine | None = None
 
 # Twitch stuff
 client_id = 'lgzs735eq4rb8o04gbpprk7ia3vge1'
@@ -44,6 +73,56 @@ client_id = 'lgzs735eq4rb8o04gbpprk7ia3vge1'
 # Global references
 twitch_obj: Twitch | None = None
 webhook_obj: EventSubWebhook | None = None
+profile_cache = BroadcasterProfileCache(ttl=PROFILE_CACHE_TTL)
+subscription_index = SubscriptionIndex()
+event_deduplicator = EventDeduplicator(ttl=EVENTSUB_DEDUP_TTL)
+# Carries go-lives from the webhook's loop over to the bot's loop
+event_bridge = EventBridge(maxsize=EVENT_QUEUE_SIZE, workers=EVENT_WORKERS)
+# Every outbound message (notifications and command replies) goes through the scheduler
+send_scheduler = SendScheduler(max_concurrency=SEND_CONCURRENCY)
+# Notifications are persisted before they are sent and retried in the background until delivered,
+# created along with the bot
+notification_outbox: NotificationOutbox | None = None
+outbox_worker: asyncio.Task | None = None
+# The cache is only an optimization, so it is warmed in the background instead of delaying the startup
+profile_warmer: asyncio.Task | None = None
+# How many times on_ready fired, anything above one is a gateway reconnect
+ready_count = 0
+# Startup stages and their timings, served as the readiness endpoint on the webhook's port
+startup = StartupTracker()
+
+
+def get_engine() -> AsyncEngine:
+    """
+    Get the engine shared by every handler, creating it on first use. It uses psycopg's async driver
+    so queries never block the event loop. Creating it does not connect, connections are opened on first query.
+
+    Parameters:
+    - None
+
+    Returns:
+    - AsyncEngine: The engine of the bot's database.
+    """
+
+    global engine
+    if engine is None:
+        engine = create_async_engine(postgres_connection_str, echo=True, pool_pre_ping=True, pool_recycle=300)
+    return engine
+
+
+def get_guild_config(guild_id: int) -> GuildConfig | None:
+    """
+    Get the configuration of a guild from memory. The subscription index is loaded at startup and written through
+    by on_guild_join, changeconfig and on_guild_remove, so permission checks and config reads skip the database.
+
+    Parameters:
+    - guild_id (int): The Discord id of the guild.
+
+    Returns:
+    - GuildConfig | None: The guild's notification channel, mode and censorship, None if the guild is unknown.
+    """
+
+    return subscription_index.get_guild(guild_id)
 
 
 async def on_stream_online(data: StreamOnlineEvent):
@@ -60,86 +139,194 @@ async def on_stream_online(data: StreamOnlineEvent):
     - None
     """
 
+    # Redeliveries of a go-live (e.g. after resubscribing) are dropped before any other work
+    if event_deduplicator.is_duplicate_event(data.event.broadcaster_user_id, data.event.started_at):
+        print(f'Ignoring duplicate stream online event for {data.event.broadcaster_user_login}')
+        return
+
     embed_strategies = [
         DraftEmbedStrategy(),
         IsisEmbedStrategy(),
         PrigozhinEmbedStrategy()
     ]
     selected_embed_strategy = random.choice(embed_strategies)
-    context = EmbedCreationContext(selected_embed_strategy)
-    embed = context.create_embed(data, bot.user.name, bot.user.avatar)
+    # Embeds are rendered on first use and shared by every guild notified for this event
+    embeds = EventEmbedCache(
+        EmbedCreationContext(selected_embed_strategy),
+        EmbedCreationContext(SafeForWorkEmbedStrategy()),
+        data,
+        bot.user.name,
+        bot.user.avatar
+    )
 
     async def send_messages():
-        # Fetch data on all the servers and users we need to notify for this streamer
-        guild_users_map = {}
-        stmt = select(Guild, UserSubscription.user_id).join(Guild.user_subscriptions).join(
-            UserSubscription.streamer).where(Streamer.streamer_id == str(data.event.broadcaster_user_id))
-        with Session(engine) as session:
-            for row in session.execute(stmt).all():
-                if row[0].guild_id not in guild_users_map:
-                    guild_users_map[row[0].guild_id] = {'notif_channel_id': row[0].notification_channel_id,
-                                                        'user_ids': set(),
-                                                        'notif_mode': row[0].notification_mode,
-                                                        'is_censored': row[0].is_censored}
-                guild_users_map[row[0].guild_id]['user_ids'].add(row[1])
-
-        # Iterate through all servers and notify users in each one
-        for guild_id, user_sub_obj in guild_users_map.items():
-            channel = bot.get_channel(int(user_sub_obj['notif_channel_id']))
+        # Events can arrive during startup, before the guild cache is filled
+        await bot.wait_until_ready()
+        # Servers and users to notify for this streamer come from the in-memory index,
+        # so fan-out does not wait on the database
+        deliveries = []
+        twitch_user = None
+        profile_looked_up = False
+        for guild_config, user_ids in subscription_index.lookup(int(data.event.broadcaster_user_id)):
+            guild_id = guild_config.guild_id
+            channel = bot.get_channel(guild_config.notification_channel_id)
             if channel:
                 # Check notification mode and act accordingly, only send if server owner
                 # is subbed in global or passive mode
-                notification_mode = user_sub_obj['notif_mode']
-                guild = bot.get_guild(int(guild_id))
-
-                # Censorship check and dynamic SFW embed generation
-                is_censored = user_sub_obj['is_censored']
-                sfw_context = EmbedCreationContext(SafeForWorkEmbedStrategy())
-                twitch_user = await first(twitch_obj.get_users(user_ids=[data.event.broadcaster_user_id]))
-                sfw_embed = sfw_context.create_embed_custom_images(
-                    data,
-                    bot.user.name,
-                    bot.user.avatar,
-                    guild.icon.url,
-                    twitch_user.profile_image_url
-                )
+                notification_mode = guild_config.notification_mode
+                guild = bot.get_guild(guild_id)
                 if notification_mode == 'global' or notification_mode == 'passive':
-                    owner_id = str(guild.owner_id)
-                    if owner_id in user_sub_obj['user_ids']:
-                        await channel.send(embed=embed if not is_censored else sfw_embed)
-                        # Send embed now for both global and passive, but only mention everyone
-                        # or here if global
-                        if notification_mode == 'global':
-                            if guild.me.guild_permissions.mention_everyone:
-                                await channel.send('@everyone')
-                            else:
-                                await channel.send(
-                                    "The bot doesn't have permission to mention everyone. Mentioning here instead.")
-                                await channel.send('@here')
+                    if guild.owner_id not in user_ids:
+                        continue
+
+                # Censorship check, the SFW embed is only rendered for censored guilds
+                if guild_config.is_censored:
+                    # The profile is looked up for the first censored guild only, so this is at most
+                    # one Helix request per event instead of one per guild. A failed lookup only costs
+                    # the profile image, it must not stop the notifications
+                    if not profile_looked_up:
+                        profile_looked_up = True
+                        try:
+                            twitch_user = await profile_cache.get(twitch_obj, data.event.broadcaster_user_id)
+                        except Exception as e:
+                            print(f'Failed to get the profile of {data.event.broadcaster_user_login}: {e}')
+                    embed = embeds.get_sfw_embed(
+                        guild.icon.url if guild.icon else None,
+                        twitch_user.profile_image_url if twitch_user else None
+                    )
                 else:
-                    await channel.send(embed=embed if not is_censored else sfw_embed)
-                    await channel.send(' '.join(f"<@{user_id}>" for user_id in user_sub_obj['user_ids']))
-
-    # Schedule in the discord.py's event loop
-    asyncio.run_coroutine_threadsafe(send_messages(), bot.loop)
+                    embed = embeds.get_embed()
+
+                # Embed and mentions are merged into as few sends as possible
+                delivery = GuildDelivery(guild_id, channel, plan_notification_messages(
+                    notification_mode,
+                    embed,
+                    user_ids,
+                    guild.me.guild_permissions.mention_everyone
+                ))
+                deliveries.append(delivery)
+
+        # Deliveries are stored in the outbox before sending, failed ones are retried by the outbox worker
+        # and a replay of the same event is not queued twice
+        event_key = f'{data.event.broadcaster_user_id}:{data.event.started_at}'
+        for result in await notification_outbox.publish(event_key, deliveries):
+            if not result.success:
+                print(f'Failed to notify guild {result.guild_id} after {result.sent} message(s), '
+                      f'will retry: {result.error}')
+
+    # Queue for the discord.py's event loop, waits here if the queue is full
+    try:
+        await event_bridge.submit(send_messages)
+    except Exception:
+        # The event was recorded as seen but never queued, let a redelivery of it through
+        event_deduplicator.forget_event(data.event.broadcaster_user_id, data.event.started_at)
+        raise
 
 
 async def subscribe_all(webhook):
     """
-    Execute a database session to iterate over all Streamer objects,
-    updating their topic_sub_id attribute by calling the webhook's listen_stream_online method with the streamer's ID
-    and the on_stream_online callback function. Finally, commit the changes made in the session.
+    Subscribe every streamer in the DB to stream.online with the on_stream_online callback, with bounded
+    concurrency and without holding a session open while waiting on Twitch. The new topic_sub_ids are
+    written back in bulk at the end, streamers that failed keep their old one and are reported.
 
     Parameters:
     - webhook (EventSubWebhook): The event data for the streamer going online.
 
+    Returns:
+    - ResubscribeReport: The topic_sub_id of every subscribed streamer and the error of every failed one.
+    """
+    async with AsyncSession(get_engine()) as session:
+        streamer_ids = (await session.scalars(select(Streamer.streamer_id))).all()
+
+    report = await resubscribe_streamers(webhook, streamer_ids, on_stream_online, SUBSCRIBE_CONCURRENCY)
+    await save_topic_sub_ids(report.subscribed)
+    if report.failed:
+        print(f'Failed to subscribe to {len(report.failed)}/{len(streamer_ids)} streamers: '
+              f'{", ".join(map(str, report.failed))}')
+    return report
+
+
+async def save_topic_sub_ids(topic_sub_ids: dict[int, str]):
+    """
+    Write new EventSub subscription ids back to the streamers table in bulk, a handful of set-based
+    statements in a single transaction no matter how many streamers changed.
+
+    Parameters:
+    - topic_sub_ids (dict[int, str]): The new topic_sub_id of each streamer, keyed by streamer id.
+
     Returns:
     - None
     """
-    with Session(engine) as session:
-        for s in session.scalars(select(Streamer)).all():
-            s.topic_sub_id = await webhook.listen_stream_online(s.streamer_id, on_stream_online)
-        session.commit()
+    if not topic_sub_ids:
+        return
+    async with AsyncSession(get_engine()) as session:
+        await bulk_update_topic_sub_ids(session, topic_sub_ids)
+        await session.commit()
+
+
+async def plan_reconciliation(webhook) -> tuple[SubscriptionPlan, dict[int, str]]:
+    """
+    Compare the stream.online subscriptions Twitch has for this webhook with the streamers in the DB and
+    start handling the healthy ones right away. Must run before the webhook starts, so that no event of a
+    reused subscription arrives before its callback is registered.
+
+    Parameters:
+    - webhook (EventSubWebhook): The webhook the reused subscriptions are registered on.
+
+    Returns:
+    - tuple[SubscriptionPlan, dict[int, str]]: The plan and the topic_sub_id of every tracked streamer.
+    """
+    async with AsyncSession(get_engine()) as session:
+        tracked = dict((await session.execute(select(Streamer.streamer_id, Streamer.topic_sub_id))).all())
+    plan = await plan_subscriptions(twitch_obj, webhook, tracked, on_stream_online)
+    print(f'Reusing {len(plan.kept)} EventSub subscriptions, {len(plan.missing)} missing, '
+          f'{len(plan.orphaned)} orphaned')
+    return plan, tracked
+
+
+async def reconcile_all(webhook, plan: SubscriptionPlan, tracked: dict[int, str]):
+    """
+    Apply a reconciliation plan: delete the orphaned subscriptions, subscribe the missing streamers and
+    store the subscription ids that changed. Costs Twitch API calls only for the difference.
+
+    Parameters:
+    - webhook (EventSubWebhook): The running webhook new subscriptions are created on.
+    - plan (SubscriptionPlan): The plan returned by plan_reconciliation.
+    - tracked (dict[int, str]): The topic_sub_id of every tracked streamer, keyed by streamer id.
+
+    Returns:
+    - ReconcileReport: The stored subscription ids, the deleted subscriptions and the streamers that failed.
+    """
+    report = await apply_subscription_plan(twitch_obj, webhook, plan, tracked, on_stream_online,
+                                           SUBSCRIBE_CONCURRENCY)
+    await save_topic_sub_ids(report.topic_sub_ids)
+    if report.failed:
+        print(f'Failed to subscribe to {len(report.failed)}/{len(plan.missing)} streamers: '
+              f'{", ".join(map(str, report.failed))}')
+    return report
+
+
+async def warm_profile_cache():
+    """
+    Prefetch the profiles of every tracked streamer into the broadcaster profile cache, so that
+    the first go-live of each streamer does not have to wait on a Twitch API call. Runs as a background task,
+    so a failure is logged instead of raised.
+
+    Parameters:
+    - None
+
+    Returns:
+    - None
+    """
+
+    try:
+        async with AsyncSession(get_engine()) as session:
+            streamer_ids = (await session.scalars(select(Streamer.streamer_id))).all()
+        fetched = await profile_cache.prefetch(twitch_obj, streamer_ids)
+    except Exception as e:
+        print(f'Failed to warm the profile cache: {e}')
+        return
+    print(f'Prefetched {fetched} streamer profile(s)')
 
 
 async def parse_streamers_from_command(streamers):
@@ -194,7 +381,6 @@ async def parse_streamers_from_command(streamers):
     return list(res)
 
 
-@bot.event
 async def on_guild_join(guild: discord.Guild):
     """
     Async function to handle actions when the bot joins a new guild.
@@ -209,42 +395,46 @@ async def on_guild_join(guild: discord.Guild):
     # Send message to first available text channel (top to bottom)
     # to configure, if no permission channel then send DM to owner
     channel = get_first_sendable_text_channel(guild)
+    # Members are not cached, so the owner is fetched on demand
+    owner = await get_guild_owner(guild)
     if channel is None:
         try:
-            await guild.owner.send("Error: Bot has no channel that it has permission to post in.")
-            print(f"Message sent to the guild owner: {guild.owner}")
+            await send_scheduler.send(owner, "Error: Bot has no channel that it has permission to post in.")
+            print(f"Message sent to the guild owner: {owner}")
         except discord.HTTPException as e:
-            print(f"Failed to send message to the guild owner: {guild.owner}")
+            print(f"Failed to send message to the guild owner: {owner}")
             print(f"Error: {e}")
         return
 
-    config_view = ConfigView(guild.owner.id, bot.user, guild)
+    config_view = ConfigView(guild.owner_id, bot.user, guild)
     embed = create_config_embed(
         'No channel configured yet',
         'default is Opt-In',
         'default is False',
         bot.user.display_name,
         bot.user.display_avatar,
-        guild.owner.display_name,
-        guild.owner.display_avatar
+        owner.display_name,
+        owner.display_avatar
     )
-    await channel.send(f'{guild.owner.mention}')
-    await channel.send(embed=embed)
-    config_view.message = await channel.send(view=config_view)
+    await send_scheduler.send(channel, f'{owner.mention}')
+    await send_scheduler.send(channel, embed=embed)
+    config_view.message = await send_scheduler.send(channel, view=config_view)
     await config_view.wait()
 
-    new_server = Guild(guild_id=str(guild.id),
-                       notification_channel_id=str(config_view.channel.id or channel.id),
+    notification_channel_id = config_view.channel.id or channel.id
+    new_server = Guild(guild_id=guild.id,
+                       notification_channel_id=notification_channel_id,
                        notification_mode=config_view.notification_mode)
-    with Session(engine) as session:
+    async with AsyncSession(get_engine()) as session:
         session.add(new_server)
-        session.commit()
+        await session.commit()
+    subscription_index.set_guild(guild.id, notification_channel_id, config_view.notification_mode, False)
 
 
-@bot.event
 async def on_guild_remove(guild: discord.Guild):
     """
     Remove a guild from the database and cascade delete related entries in the user subscriptions table and potentially in the streamer table.
+    The EventSub subscriptions of the streamers that are no longer tracked are deleted, so they stop sending events.
 
     Parameters:
     - guild (discord.Guild): The guild to be removed from the database.
@@ -255,25 +445,25 @@ async def on_guild_remove(guild: discord.Guild):
 
     # Remove guild from guilds DB, don't have objects of guild
     # so need to do it with Core/non-Unit of Work pattern
-    with Session(engine) as session:
-        session.execute(delete(Guild).where(Guild.guild_id == str(guild.id)))
+    async with AsyncSession(get_engine()) as session:
+        await session.execute(delete(Guild).where(Guild.guild_id == guild.id))
 
         # Cascade occurs and user subs table should have some entries removed
-        # if it referred to the guild just deleted. See if we need to prune
-        # streamer table as well since we might have deleted all refs to a streamer
-        # in user sub table with cascade
-        stmt = select(Streamer).outerjoin(UserSubscription).where(UserSubscription.streamer_id == None)
-        streamers_to_delete = session.scalars(stmt).all()
-        for streamer in streamers_to_delete:
-            session.delete(streamer)
-        session.commit()
-
-
-@bot.command(name='notify', description='Get notified when a streamer goes live!')
-@is_owner_or_optin_mode(engine)
+        # if it referred to the guild just deleted. Prune the streamers that lost
+        # their last subscription with one set-based delete
+        orphaned = await delete_orphaned_streamers(session)
+        await session.commit()
+    subscription_index.remove_guild(guild.id)
+    failed = await unsubscribe_topics(webhook_obj, orphaned, SUBSCRIBE_CONCURRENCY)
+    print(f'Left guild {guild.id}, released {len(orphaned) - len(failed)}/{len(orphaned)} EventSub subscription(s)')
+
+
+@commands.command(name='notify', description='Get notified when a streamer goes live!')
+@is_owner_or_optin_mode(get_engine, get_guild_config)
 async def notify(ctx, *streamers):
     """
-    Notify users about the given streamers and handle subscriptions.
+    Notify users about the given streamers and handle subscriptions. Subscriptions the user already has
+    are skipped and reported without undoing the new ones.
 
     Parameters:
     - ctx: The context of the command invocation.
@@ -287,41 +477,46 @@ async def notify(ctx, *streamers):
         raise ValueError('Global reference not initialized...')
     clean_streamers = await parse_streamers_from_command(streamers)
     if not clean_streamers:
-        return await ctx.send(
+        return await send_scheduler.send(
+            ctx,
             f'{ctx.author.mention} Unable to find one of the given streamer(s), please try again... MAGGOT!')
-    with Session(engine) as session:
-        # Check if we need to insert streamer into streamer table
-        # (if it is first time streamer is ever being watched)
-        # Commit before try catch to avoid foreign key constraint
-        # Needs to exist in streamer table before insert into user sub
-        for s in clean_streamers:
-            streamer = session.scalar(select(Streamer).where(Streamer.streamer_id == s.id))
-            if not streamer:
-                topic = await webhook_obj.listen_stream_online(s.id, on_stream_online)
-                new_streamer = Streamer(streamer_id=s.id, streamer_name=s.name, topic_sub_id=topic)
-                session.add(new_streamer)
-        session.commit()
-
-        # If streamer already in streamer table and user runs dupe notify
-        # then this try catch block will handle dupe command
-        try:
-            session.execute(
-                insert(UserSubscription),
-                [
-                    {
-                        "user_id": str(ctx.author.id),
-                        "guild_id": str(ctx.guild.id),
-                        "streamer_id": s.id
-                    } for s in clean_streamers
-                ]
-            )
-            session.commit()
-            await ctx.send(f'{ctx.author.mention} will now be notified of when the following streamers are live: `{", ".join([s.name for s in clean_streamers])}`')
-        except IntegrityError:
-            session.rollback()
-            await ctx.send(
-                f'{ctx.author.mention} you are already subscribed to some or all of the streamer(s)! Reverting...'
-            )
+    streamer_ids = [s.id for s in clean_streamers]
+    # A fixed number of statements no matter how many streamers are given, only the streamers nobody tracks
+    # yet cost a (concurrent) EventSub subscription. No transaction is held open while those are created
+    async with AsyncSession(get_engine()) as session:
+        tracked = set((await session.scalars(
+            select(Streamer.streamer_id).where(Streamer.streamer_id.in_(streamer_ids)))).all())
+    untracked = [s for s in clean_streamers if s.id not in tracked]
+    report = await resubscribe_streamers(webhook_obj, [s.id for s in untracked], on_stream_online,
+                                         SUBSCRIBE_CONCURRENCY)
+    try:
+        async with AsyncSession(get_engine()) as session:
+            inserted = await insert_streamers(session, [
+                {'streamer_id': s.id, 'streamer_name': s.name, 'topic_sub_id': report.subscribed[s.id]}
+                for s in untracked if s.id in report.subscribed
+            ])
+            new_ids = await insert_user_subscriptions(
+                session, ctx.author.id, ctx.guild.id, [s for s in streamer_ids if s not in report.failed])
+            await session.commit()
+    except Exception:
+        # Nothing references the new subscriptions, don't leave them behind on Twitch
+        await unsubscribe_topics(webhook_obj, report.subscribed, SUBSCRIBE_CONCURRENCY)
+        raise
+
+    # Streamers another command started tracking in the meantime keep its subscription, ours is redundant
+    await unsubscribe_topics(webhook_obj, {s: topic for s, topic in report.subscribed.items() if s not in inserted},
+                             SUBSCRIBE_CONCURRENCY)
+
+    subscribed = [s for s in clean_streamers if s.id in new_ids]
+    already_subscribed = [s for s in clean_streamers if s.id not in new_ids and s.id not in report.failed]
+    failed = [s for s in clean_streamers if s.id in report.failed]
+    subscription_index.add_subscriptions(ctx.guild.id, ctx.author.id, [s.id for s in subscribed])
+    if subscribed:
+        await send_scheduler.send(ctx, f'{ctx.author.mention} will now be notified of when the following streamers are live: `{", ".join([s.name for s in subscribed])}`')
+    if already_subscribed:
+        await send_scheduler.send(ctx, f'{ctx.author.mention} you are already subscribed to: `{", ".join([s.name for s in already_subscribed])}`')
+    if failed:
+        await send_scheduler.send(ctx, f'{ctx.author.mention} Unable to subscribe to: `{", ".join([s.name for s in failed])}`, please try again later...')
 
 
 @notify.error
@@ -337,14 +532,38 @@ async def notify_error(ctx, error):
     """
 
     print(error)
-    await ctx.send(
+    await send_scheduler.send(
+        ctx,
         f"{ctx.author.mention} You don't have permission to use this command...",
         ephemeral=True
     )
 
 
-@bot.command(name='unnotify', description='Unsubscribe from notification when a streamer goes live!')
-@is_owner_or_optin_mode(engine)
+async def unsubscribe_author(ctx, streamer_ids: list[int] | None = None) -> dict[int, str]:
+    """
+    Unsubscribe the author of a command from streamers in the command's guild. The subscriptions are removed with
+    one DELETE ... RETURNING and the streamers nobody is subscribed to anymore with one anti-join, in a single
+    transaction. The EventSub subscriptions of those streamers are then deleted concurrently.
+
+    Parameters:
+    - ctx (Context): The context of the command.
+    - streamer_ids (list[int] | None): The ids of the streamers to unsubscribe from, every streamer if None.
+
+    Returns:
+    - dict[int, str]: The name of every streamer the author was unsubscribed from, keyed by streamer id.
+    """
+
+    async with AsyncSession(get_engine()) as session:
+        removed = await delete_user_subscriptions(session, ctx.author.id, ctx.guild.id, streamer_ids)
+        orphaned = await delete_orphaned_streamers(session, removed)
+        await session.commit()
+    subscription_index.remove_subscriptions(ctx.guild.id, ctx.author.id, list(removed))
+    await unsubscribe_topics(webhook_obj, orphaned, SUBSCRIBE_CONCURRENCY)
+    return removed
+
+
+@commands.command(name='unnotify', description='Unsubscribe from notification when a streamer goes live!')
+@is_owner_or_optin_mode(get_engine, get_guild_config)
 async def unnotify(ctx, *streamers):
     """
     Unnotify users from receiving notifications for specific streamers.
@@ -359,51 +578,68 @@ async def unnotify(ctx, *streamers):
     Raises:
     - ValueError: If the global variable 'webhook_obj' is not initialized.
 
-    The function checks if the 'webhook_obj' global variable is initialized. It then parses the input streamers to extract valid streamer IDs and names. For each streamer, it checks if the user is subscribed and removes the subscription. If no references to the streamer remain, it unsubscribes from the streamer's topic. Finally, it sends messages to the user indicating success or failure of the unsubscription process.
+    The function checks if the 'webhook_obj' global variable is initialized. It then parses the input streamers to extract valid streamer IDs and names, and removes the user's subscriptions to them with a fixed number of statements (see unsubscribe_author). Streamers nobody is subscribed to anymore are no longer tracked and their topics are unsubscribed. Finally, it sends messages to the user indicating success or failure of the unsubscription process.
     """
 
     if webhook_obj is None:
         raise ValueError('Global reference not initialized...')
-    success = []
-    fail = []
     clean_streamers = await parse_streamers_from_command(streamers)
     if not clean_streamers:
-        return await ctx.send(f'{ctx.author.mention} Unable to find given streamer, please try again... MAGGOT!')
-
-    with Session(engine) as session:
-        for original_arg, s in zip(streamers, clean_streamers):
-            user_sub = session.scalar(
-                select(UserSubscription).join(UserSubscription.streamer).where(
-                    UserSubscription.user_id == str(ctx.author.id),
-                    UserSubscription.guild_id == str(ctx.guild.id),
-                    Streamer.streamer_id == s.id
-                )
-            )
-            if user_sub:
-                session.delete(user_sub)
-                success.append(user_sub.streamer.streamer_name)
-
-                # Check if streamer references are still in user subs, remove from streamer table if not
-                # Can just check for existence of one (first) record, don't need to query all records if
-                # there is at least one record
-                streamer_refs = session.scalars(
-                    select(UserSubscription).where(UserSubscription.streamer_id == s.id)).first()
-                if not streamer_refs:
-                    streamer = session.scalar(select(Streamer).where(Streamer.streamer_id == s.id))
-                    status = await webhook_obj.unsubscribe_topic(streamer.topic_sub_id)
-                    print(f'unsubbing topic {streamer.topic_sub_id} from streamer {streamer.streamer_name}')
-                    if not status:
-                        print(f'failed to unsubscribe from streamer through API!')
-                    session.delete(streamer)
-            else:
-                fail.append(original_arg)
-
-        session.commit()
+        return await send_scheduler.send(ctx, f'{ctx.author.mention} Unable to find given streamer, please try again... MAGGOT!')
 
+    removed = await unsubscribe_author(ctx, [s.id for s in clean_streamers])
+    success = [removed[s.id] for s in clean_streamers if s.id in removed]
+    fail = [s.name for s in clean_streamers if s.id not in removed]
     if success:
-        await ctx.send(f'{ctx.author.mention} You will no longer be notified for: `{", ".join(success)}`!')
+        await send_scheduler.send(ctx, f'{ctx.author.mention} You will no longer be notified for: `{", ".join(success)}`!')
     if fail:
-        await ctx.send(f'{ctx.author.mention} Unable to unsubscribe from: `{", ".join(fail)}`!')
+        await send_scheduler.send(ctx, f'{ctx.author.mention} Unable to unsubscribe from: `{", ".join(fail)}`!')
+
+
+@commands.command(name='unnotifyall', description='Unsubscribe from every streamer in this server!')
+@is_owner_or_optin_mode(get_engine, get_guild_config)
+async def unnotifyall(ctx):
+    """
+    Unnotify the user from every streamer they are subscribed to in the guild.
+
+    Parameters:
+    - ctx (Context): The context of the command.
+
+    Returns:
+    - None
+
+    Raises:
+    - ValueError: If the global variable 'webhook_obj' is not initialized.
+    """
+
+    if webhook_obj is None:
+        raise ValueError('Global reference not initialized...')
+    removed = await unsubscribe_author(ctx)
+    if removed:
+        await send_scheduler.send(ctx, f'{ctx.author.mention} You will no longer be notified for: `{", ".join(sorted(removed.values()))}`!')
+    else:
+        await send_scheduler.send(ctx, f'{ctx.author.mention} You are not subscribed to any streamer!')
+
+
+@unnotifyall.error
+async def unnotifyall_error(ctx, error):
+    """
+    Prints the error message and sends a permission denial message to the user.
+
+    Parameters:
+    - ctx (Context): The context of the command.
+    - error (Exception): The error that occurred during the unnotifyall process.
+
+    Returns:
+    - None
+    """
+
+    print(error)
+    await send_scheduler.send(
+        ctx,
+        f"{ctx.author.mention} You don't have permission to use this command...",
+        ephemeral=True
+    )
 
 
 @unnotify.error
@@ -422,13 +658,14 @@ async def unnotify_error(ctx, error):
     """
 
     print(error)
-    await ctx.send(
+    await send_scheduler.send(
+        ctx,
         f"{ctx.author.mention} You don't have permission to use this command...",
         ephemeral=True
     )
 
 
-@bot.hybrid_command(name='notifs', description='Get current streamers that you are getting notifications for.')
+@commands.hybrid_command(name='notifs', description='Get current streamers that you are getting notifications for.')
 async def notifs(ctx):
     """
     Function to display notification subscriptions for a user in a specific guild.
@@ -440,13 +677,13 @@ async def notifs(ctx):
     - None
     """
 
-    with Session(engine) as session:
-        notified_streamers = session.scalars(
+    async with AsyncSession(get_engine()) as session:
+        notified_streamers = (await session.scalars(
             select(Streamer.streamer_name).join(Streamer.user_subscriptions).where(
-                UserSubscription.user_id == str(ctx.author.id),
-                UserSubscription.guild_id == str(ctx.guild.id)
+                UserSubscription.user_id == ctx.author.id,
+                UserSubscription.guild_id == ctx.guild.id
             )
-        ).all()
+        )).all()
 
         if notified_streamers:
             embed = discord.Embed(title="Your Notification Subscriptions",
@@ -459,12 +696,12 @@ async def notifs(ctx):
                                 inline=False)
             else:
                 embed.add_field(name="Subscribed Streamers", value=subscriptions_text, inline=False)
-            await ctx.send(embed=embed)
+            await send_scheduler.send(ctx, embed=embed)
         else:
-            await ctx.send(f'{ctx.author.mention} You are not receiving notifications in {ctx.guild.name}!')
+            await send_scheduler.send(ctx, f'{ctx.author.mention} You are not receiving notifications in {ctx.guild.name}!')
 
 
-@bot.hybrid_command(name='changeconfig', description='Change configuration of the bot server-wide.')
+@commands.hybrid_command(name='changeconfig', description='Change configuration of the bot server-wide.')
 @app_commands.check(is_owner)
 async def changeconfig(ctx):
     """
@@ -477,33 +714,37 @@ async def changeconfig(ctx):
     - None
     """
 
-    with Session(engine) as session:
-        guild_config = session.scalar(select(Guild).where(Guild.guild_id == str(ctx.guild.id)))
-        embed = create_config_embed(bot.get_channel(int(guild_config.notification_channel_id)).name,
-                                    guild_config.notification_mode,
-                                    str(guild_config.is_censored),
-                                    bot.user.name,
-                                    bot.user.display_avatar,
-                                    ctx.author.display_name,
-                                    ctx.author.display_avatar)
-        await ctx.send(embed=embed)
-    view = ConfigView(ctx.guild.owner.id, bot.user, ctx.guild)
-    view.message = await ctx.send(view=view)
+    guild_config = get_guild_config(ctx.guild.id)
+    if guild_config is None:
+        async with AsyncSession(get_engine()) as session:
+            guild_config = await session.scalar(select(Guild).where(Guild.guild_id == ctx.guild.id))
+    embed = create_config_embed(bot.get_channel(guild_config.notification_channel_id).name,
+                                guild_config.notification_mode,
+                                str(guild_config.is_censored),
+                                bot.user.name,
+                                bot.user.display_avatar,
+                                ctx.author.display_name,
+                                ctx.author.display_avatar)
+    await send_scheduler.send(ctx, embed=embed)
+    view = ConfigView(ctx.guild.owner_id, bot.user, ctx.guild)
+    view.message = await send_scheduler.send(ctx, view=view)
     await view.wait()
 
     # Write to DB here after getting values from view
     channel = get_first_sendable_text_channel(ctx.guild)
-    with Session(engine) as session:
-        session.execute(
+    notification_channel_id = view.channel.id or channel.id
+    async with AsyncSession(get_engine()) as session:
+        await session.execute(
             update(Guild).
-            where(Guild.guild_id == str(ctx.guild.id)).
+            where(Guild.guild_id == ctx.guild.id).
             values(
-                notification_channel_id=str(view.channel.id or channel.id),
+                notification_channel_id=notification_channel_id,
                 notification_mode=view.notification_mode,
                 is_censored=view.is_censored,
             )
         )
-        session.commit()
+        await session.commit()
+    subscription_index.set_guild(ctx.guild.id, notification_channel_id, view.notification_mode, view.is_censored)
 
 
 @changeconfig.error
@@ -520,13 +761,52 @@ async def changeconfig_error(ctx, error):
     """
 
     print(error)
-    await ctx.send(
+    await send_scheduler.send(
+        ctx,
+        f"{ctx.author.mention} You don't have permission to use this command...",
+        ephemeral=True
+    )
+
+
+@commands.command(name='synccommands', description='Force a sync of the application commands with Discord.')
+@commands.is_owner()
+async def synccommands(ctx):
+    """
+    Sync the application commands with Discord even if the command tree did not change. Only usable by the owner of the bot.
+
+    Parameters:
+    - ctx (discord.Context): The context of the command invocation.
+
+    Returns:
+    - None
+    """
+
+    await sync_command_tree(bot.tree, get_engine(), force=True)
+    await send_scheduler.send(ctx, f'{ctx.author.mention} Application commands synced!')
+
+
+@synccommands.error
+async def synccommands_error(ctx, error):
+    """
+    Sync commands error handler function.
+
+    Parameters:
+    - ctx (discord.Context): The context of the command invocation.
+    - error (Exception): The error that occurred during the execution of the command.
+
+    Returns:
+    - None
+    """
+
+    print(error)
+    await send_scheduler.send(
+        ctx,
         f"{ctx.author.mention} You don't have permission to use this command...",
         ephemeral=True
     )
 
 
-# @bot.hybrid_command(name='test', description='for testing code when executed')
+# @commands.hybrid_command(name='test', description='for testing code when executed')
 # async def test(ctx):
 #     test_data = StreamOnlineEvent()
 #     test_data.event = StreamOnlineData()
@@ -544,11 +824,29 @@ async def changeconfig_error(ctx, error):
 #     await ctx.send(embed=embed)
 
 
-@bot.event
-async def on_ready():
+async def run_outbox_worker():
     """
-    Handle the event when the bot is ready and connected to Discord.
+    Send the notifications waiting in the outbox for as long as the bot runs, retrying failed deliveries.
+
+    Parameters:
+    - None
+
+    Returns:
+    - None
+    """
+
+    # Channels of queued notifications can only be resolved once the guild cache is filled
+    await bot.wait_until_ready()
+    await notification_outbox.run()
+
+
+async def setup_hook():
+    """
+    Run the one-time startup of the bot, after logging in and before connecting to the gateway.
     Initialize the Twitch API client, set up the EventSub webhook, subscribe to streamers, and synchronize the bot's internal state.
+    Unlike on_ready, this is not run again when the gateway reconnects. Every stage is marked on the startup
+    tracker, which times it and serves the readiness endpoint. Discord only connects once this returns, so no
+    command can arrive before the subscriptions are reconciled.
 
     Parameters:
     - None
@@ -557,8 +855,13 @@ async def on_ready():
     - None
     """
 
-    print(f'{bot.user.name} has connected to Discord!')
+    # Fan-out reads subscriptions from memory, so load them before any event can arrive
+    async with AsyncSession(get_engine()) as session:
+        await subscription_index.load(session)
+    startup.mark('db_ready')
+    event_bridge.start()
     twitch = await Twitch(client_id, client_secret)
+    startup.mark('twitch_auth')
     global twitch_obj
     twitch_obj = twitch
     # Set up EventSub webhook
@@ -568,16 +871,119 @@ async def on_ready():
     webhook = EventSubWebhook(WEBHOOK_URL, 8080, twitch)
     global webhook_obj
     webhook.unsubscribe_on_stop = False
-    await webhook.unsubscribe_all()
-    webhook.start()
-    webhook_obj = webhook
-    print("Subscribing to streamers... Please wait...")
-    await subscribe_all(webhook)
+    # Replace the webhook's short message id history (last 50 ids) with the TTL cache,
+    # so that redelivered message ids are dropped before the event is even parsed
+    webhook._msg_id_history = event_deduplicator
+    serve_health_checks(webhook, startup, alive=lambda: not bot.is_closed(),
+                        metrics=lambda: {'event_queue': event_bridge.metrics().to_dict()})
+    if EVENTSUB_SECRET:
+        # With a stable secret the subscriptions of the previous run are still valid,
+        # so only the difference with the DB is fixed instead of resubscribing everything
+        webhook.secret = EVENTSUB_SECRET
+        plan, tracked = await plan_reconciliation(webhook)
+        webhook.start()
+        webhook_obj = webhook
+        startup.mark('webhook_listening')
+        print("Subscribing to streamers... Please wait...")
+        await reconcile_all(webhook, plan, tracked)
+    else:
+        print('Warning: EVENTSUB_SECRET is not set, every EventSub subscription is deleted and recreated on '
+              'startup. Set it as a secret to keep the subscriptions across restarts')
+        await webhook.unsubscribe_all()
+        webhook.start()
+        webhook_obj = webhook
+        startup.mark('webhook_listening')
+        print("Subscribing to streamers... Please wait...")
+        await subscribe_all(webhook)
     print("Successfully subscribed to all streamers in the DB!")
-    await bot.tree.sync()
+    startup.mark('subscriptions_reconciled')
+    global profile_warmer
+    if profile_warmer is None or profile_warmer.done():
+        profile_warmer = asyncio.create_task(warm_profile_cache())
+    global outbox_worker
+    if outbox_worker is None or outbox_worker.done():
+        outbox_worker = asyncio.create_task(run_outbox_worker())
+    # Syncing is heavily rate limited, so it is skipped unless the command tree changed
+    if await sync_command_tree(bot.tree, get_engine()):
+        print("Synced application commands with Discord")
+    else:
+        print("Application commands unchanged, skipped sync")
+    startup.mark('commands_synced')
+
+
+async def on_ready():
+    """
+    Handle the event when the bot is ready and connected to Discord. discord.py fires this again after every
+    reconnect that could not resume the session, so it must stay cheap: all of the startup work is done once
+    in setup_hook.
+
+    Parameters:
+    - None
+
+    Returns:
+    - None
+    """
+
+    global ready_count
+    ready_count += 1
+    if ready_count == 1:
+        print(f'{bot.user.name} has connected to Discord!')
+        startup.mark('discord_connected')
+    else:
+        print(f'{bot.user.name} has reconnected to Discord! (ready #{ready_count})')
+
+
+async def on_resumed():
+    """
+    Log that the gateway session was resumed. Resumes replay the missed events, so no state is reloaded.
+
+    Parameters:
+    - None
+
+    Returns:
+    - None
+    """
+
+    print(f'{bot.user.name} resumed its Discord session')
+
+
+def create_bot() -> commands.Bot:
+    """
+    Build the bot: create it with its event handlers and commands, along with the database engine and the
+    notification outbox. Nothing connects until the bot is started.
+
+    Parameters:
+    - None
+
+    Returns:
+    - commands.Bot: The bot, ready to be run.
+    """
+
+    global bot, notification_outbox
+    # Members and presences are neither requested nor cached: fan-out works from stored user ids
+    # and the owner checks only need guild.owner_id
+    bot = commands.Bot(
+        command_prefix='!',
+        intents=minimal_intents(),
+        member_cache_flags=discord.MemberCacheFlags.none(),
+        chunk_guilds_at_startup=False,
+        max_messages=MESSAGE_CACHE_SIZE
+    )
+    for handler in (setup_hook, on_ready, on_resumed, on_guild_join, on_guild_remove):
+        bot.event(handler)
+    for command in (notify, unnotify, unnotifyall, notifs, changeconfig, synccommands):
+        bot.add_command(command)
+    notification_outbox = NotificationOutbox(
+        get_engine(),
+        send_scheduler,
+        bot.get_channel,
+        FANOUT_CONCURRENCY,
+        retention=OUTBOX_RETENTION
+    )
+    return bot
 
 
 if __name__ == '__main__':
     # When pytest imports this file this runs the bot without this check
     # since when importing the imported file is executed...
-    bot.run(TOKEN)
+    create_bot().run(TOKEN)
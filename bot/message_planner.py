@@ -0,0 +1,74 @@
+from typing import Iterable
+
+import discord
+
+# Max number of characters in the content of a Discord message
+DISCORD_MESSAGE_LIMIT = 2000
+
+MISSING_MENTION_EVERYONE_WARNING = "The bot doesn't have permission to mention everyone. Mentioning here instead."
+
+OPTIN_ALLOWED_MENTIONS = discord.AllowedMentions(everyone=False, users=True, roles=False)
+GLOBAL_ALLOWED_MENTIONS = discord.AllowedMentions(everyone=True, users=False, roles=False)
+PASSIVE_ALLOWED_MENTIONS = discord.AllowedMentions.none()
+
+
+def chunk_mentions(user_ids: Iterable[int], limit: int = DISCORD_MESSAGE_LIMIT) -> list[str]:
+    """
+    Pack user mentions into as few space separated messages as possible without going over the size limit.
+
+    Parameters:
+    - user_ids (Iterable[int]): The ids of the users to mention.
+    - limit (int): The max number of characters of each message.
+
+    Returns:
+    - list[str]: The contents of the messages, in order. Empty if there is nobody to mention.
+    """
+
+    chunks = []
+    current = ''
+    for user_id in user_ids:
+        mention = f'<@{user_id}>'
+        if not current:
+            current = mention
+        elif len(current) + 1 + len(mention) <= limit:
+            current += ' ' + mention
+        else:
+            chunks.append(current)
+            current = mention
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def plan_notification_messages(notification_mode: str,
+                               embed: discord.Embed,
+                               user_ids: Iterable[int],
+                               can_mention_everyone: bool) -> list[dict]:
+    """
+    Plan the fewest channel.send calls needed to notify a guild. The embed always rides along with the
+    first message's content, opt-in mention lists are split at the message size limit and every message
+    only allows the mentions its mode is meant to ping.
+
+    Parameters:
+    - notification_mode (str): The notification mode of the guild ('optin', 'global' or 'passive').
+    - embed (discord.Embed): The notification embed.
+    - user_ids (Iterable[int]): The ids of the subscribed users, only mentioned in opt-in mode.
+    - can_mention_everyone (bool): Whether the bot may mention everyone in the notification channel.
+
+    Returns:
+    - list[dict]: Keyword arguments for each channel.send call, in the order they must be sent.
+    """
+
+    if notification_mode == 'passive':
+        return [{'embed': embed, 'allowed_mentions': PASSIVE_ALLOWED_MENTIONS}]
+
+    if notification_mode == 'global':
+        content = '@everyone' if can_mention_everyone else f'{MISSING_MENTION_EVERYONE_WARNING}\n@here'
+        return [{'content': content, 'embed': embed, 'allowed_mentions': GLOBAL_ALLOWED_MENTIONS}]
+
+    chunks = chunk_mentions(sorted(user_ids))
+    if not chunks:
+        return [{'embed': embed, 'allowed_mentions': OPTIN_ALLOWED_MENTIONS}]
+    messages = [{'content': chunks[0], 'embed': embed, 'allowed_mentions': OPTIN_ALLOWED_MENTIONS}]
+    messages.extend({'content': chunk, 'allowed_mentions': OPTIN_ALLOWED_MENTIONS} for chunk in chunks[1:])
+    return messages
@@ -1,13 +1,14 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from dataclasses import dataclass
 
-from sqlalchemy import UniqueConstraint, ForeignKey
+from sqlalchemy import BigInteger, UniqueConstraint, ForeignKey, Index, JSON, DateTime, func
 from sqlalchemy.orm import DeclarativeBase, mapped_column, Mapped, relationship
 
 
 @dataclass(frozen=True)
 class GetUsersStreamer:
-    id: str
+    id: int
     name: str
 
     def __hash__(self):
@@ -18,10 +19,11 @@ class Base(DeclarativeBase):
     pass
 
 
+# Discord snowflakes and Twitch user ids are stored as BIGINT
 class Guild(Base):
     __tablename__ = 'guilds'
-    guild_id: Mapped[str] = mapped_column(primary_key=True)
-    notification_channel_id: Mapped[str]
+    guild_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    notification_channel_id: Mapped[int] = mapped_column(BigInteger)
     user_subscriptions: Mapped[List["UserSubscription"]] = relationship(back_populates='guild',
                                                                         passive_deletes=True,
                                                                         cascade='all, delete-orphan')
@@ -31,7 +33,7 @@ class Guild(Base):
 
 class Streamer(Base):
     __tablename__ = 'streamers'
-    streamer_id: Mapped[str] = mapped_column(primary_key=True)
+    streamer_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
     streamer_name: Mapped[str]
     topic_sub_id: Mapped[str]
     user_subscriptions: Mapped[List["UserSubscription"]] = relationship(back_populates='streamer')
@@ -40,11 +42,40 @@ class Streamer(Base):
 class UserSubscription(Base):
     __tablename__ = 'user_subscriptions'
     id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[str] = mapped_column(nullable=False)
-    guild_id: Mapped[str] = mapped_column(ForeignKey('guilds.guild_id', ondelete='CASCADE'))
-    streamer_id: Mapped[str] = mapped_column(ForeignKey('streamers.streamer_id'))
+    user_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    guild_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('guilds.guild_id', ondelete='CASCADE'))
+    streamer_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('streamers.streamer_id'))
     __table_args__ = (
         UniqueConstraint('user_id', 'guild_id', 'streamer_id', name='uix_1'),
+        # Lookups and orphan checks by streamer, and deletes by guild (which uix_1 can't serve as it leads with user_id)
+        Index('ix_user_subscriptions_streamer_id', 'streamer_id'),
+        Index('ix_user_subscriptions_guild_id_user_id', 'guild_id', 'user_id'),
     )
     guild: Mapped["Guild"] = relationship(back_populates="user_subscriptions")
     streamer: Mapped["Streamer"] = relationship(back_populates="user_subscriptions")
+
+
+class NotificationOutboxEntry(Base):
+    __tablename__ = 'notification_outbox'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # One row per stream online event per guild, so a replayed event never queues a second notification
+    idempotency_key: Mapped[str] = mapped_column(unique=True)
+    guild_id: Mapped[int] = mapped_column(BigInteger)
+    channel_id: Mapped[int] = mapped_column(BigInteger)
+    # channel.send keyword arguments of each message, see bot.outbox.serialize_message
+    payload: Mapped[list] = mapped_column(JSON)
+    status: Mapped[str] = mapped_column(default='pending')
+    attempts: Mapped[int] = mapped_column(default=0)
+    sent_count: Mapped[int] = mapped_column(default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    last_error: Mapped[Optional[str]]
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (
+        Index('ix_notification_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+
+class BotSetting(Base):
+    __tablename__ = 'bot_settings'
+    key: Mapped[str] = mapped_column(primary_key=True)
+    value: Mapped[str]
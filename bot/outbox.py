@@ -0,0 +1,353 @@
+import asyncio
+from datetime import timedelta
+from typing import Callable, Optional
+
+import discord
+from sqlalchemy import Float, Integer, String, case, cast, column, delete, select, update, func, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from bot.bulk_ops import chunked
+from bot.fanout import GuildDelivery, DeliveryResult, fan_out
+from bot.models import NotificationOutboxEntry
+from bot.send_scheduler import SendScheduler
+
+# Rows per UPDATE ... FROM (VALUES ...) when recording outcomes, six bind parameters each
+OUTCOME_CHUNK_SIZE = 1000
+
+
+def serialize_message(message: dict) -> dict:
+    """
+    Turn the channel.send keyword arguments of a planned message into JSON that can be stored in the outbox.
+
+    Parameters:
+    - message (dict): Keyword arguments for channel.send (content, embed and allowed_mentions).
+
+    Returns:
+    - dict: The JSON serializable form of the message.
+    """
+
+    data = {}
+    if 'content' in message:
+        data['content'] = message['content']
+    if 'embed' in message:
+        data['embed'] = message['embed'].to_dict()
+    if 'allowed_mentions' in message:
+        allowed_mentions = message['allowed_mentions']
+        data['allowed_mentions'] = {
+            'everyone': allowed_mentions.everyone,
+            'users': allowed_mentions.users,
+            'roles': allowed_mentions.roles
+        }
+    return data
+
+
+def deserialize_message(data: dict) -> dict:
+    """
+    Turn a message stored in the outbox back into channel.send keyword arguments.
+
+    Parameters:
+    - data (dict): The stored message, as returned by serialize_message.
+
+    Returns:
+    - dict: Keyword arguments for channel.send.
+    """
+
+    message = {}
+    if 'content' in data:
+        message['content'] = data['content']
+    if 'embed' in data:
+        message['embed'] = discord.Embed.from_dict(data['embed'])
+    if 'allowed_mentions' in data:
+        message['allowed_mentions'] = discord.AllowedMentions(**data['allowed_mentions'])
+    return message
+
+
+class NotificationOutbox:
+    """
+    Durable queue of stream online notifications. Every guild delivery is written to the notification_outbox
+    table before anything is sent, so a crash or a Discord error partway through a fan-out never loses the
+    guilds that were not notified yet. New rows are sent right away, rows that failed (or whose sender died)
+    are picked up again by the worker loop with exponential backoff.
+
+    Rows are claimed with a lease instead of a long transaction: claiming pushes next_attempt_at past the lease,
+    so nobody else picks the row up while it is being sent, and it comes back on its own if the sender dies.
+    The lease is renewed while the sends are still running, so a long, rate limited fan-out is not claimed
+    a second time. Delivery is at least once, messages of a row that were sent before a crash may be sent again.
+
+    If the outbox can't be written (the database is down or the pool is exhausted) the deliveries are sent
+    directly, without retries, rather than not at all. Rows that are done, sent or failed for good, are deleted
+    once they are older than the retention period.
+
+    Parameters:
+    - engine (AsyncEngine): The engine used to read and write the outbox table.
+    - scheduler (SendScheduler): Paces the sends against Discord's rate limits.
+    - resolve_channel (Callable[[int], Optional[discord.abc.Messageable]]): Gets a channel from its id.
+    - concurrency (int): The maximum number of guilds being sent to at the same time.
+    - batch_size (int): How many rows the worker claims at once.
+    - max_attempts (int): How many times a row is tried before it is marked as failed.
+    - base_backoff (float): Seconds to wait before the first retry, doubled on every following one.
+    - max_backoff (float): The longest wait between two retries, in seconds.
+    - lease (float): How long a claimed row is hidden from other senders, in seconds.
+    - retention (float): How long sent and failed rows are kept, in seconds.
+    - purge_batch_size (int): How many rows are deleted per statement.
+
+    Methods:
+    - publish(event_key, deliveries): Stores the deliveries of an event and sends them.
+    - drain_once(): Sends one batch of rows that are due.
+    - purge(): Deletes the sent and failed rows older than the retention period.
+    - run(poll_interval, purge_interval): Drains the outbox forever and purges it periodically.
+    """
+
+    def __init__(self,
+                 engine: AsyncEngine,
+                 scheduler: SendScheduler,
+                 resolve_channel: Callable[[int], Optional[discord.abc.Messageable]],
+                 concurrency: int,
+                 batch_size: int = 50,
+                 max_attempts: int = 5,
+                 base_backoff: float = 5.0,
+                 max_backoff: float = 900.0,
+                 lease: float = 120.0,
+                 retention: float = 7 * 24 * 3600,
+                 purge_batch_size: int = 1000):
+        self.engine = engine
+        self.scheduler = scheduler
+        self.resolve_channel = resolve_channel
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.retention = retention
+        self.purge_batch_size = purge_batch_size
+
+    def backoff(self, attempts: int) -> float:
+        return min(self.max_backoff, self.base_backoff * 2 ** max(0, attempts - 1))
+
+    async def enqueue(self, event_key: str, deliveries: list[GuildDelivery]) -> dict[int, int]:
+        """
+        Store the deliveries of an event, already leased to the caller. Deliveries already stored for the
+        same event are skipped.
+
+        Parameters:
+        - event_key (str): Identifies the stream online event, e.g. broadcaster id and start time.
+        - deliveries (list[GuildDelivery]): The deliveries to store.
+
+        Returns:
+        - dict[int, int]: The outbox row id of every newly stored delivery, keyed by guild id.
+        """
+
+        if not deliveries:
+            return {}
+        rows = [{
+            'idempotency_key': f'{event_key}:{delivery.guild_id}',
+            'guild_id': delivery.guild_id,
+            'channel_id': delivery.channel.id,
+            'payload': [serialize_message(message) for message in delivery.messages],
+            'status': 'pending',
+            'attempts': 0,
+            'sent_count': 0,
+            'next_attempt_at': func.now() + timedelta(seconds=self.lease)
+        } for delivery in deliveries]
+        stmt = (pg_insert(NotificationOutboxEntry)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=['idempotency_key'])
+                .returning(NotificationOutboxEntry.id, NotificationOutboxEntry.guild_id))
+        async with AsyncSession(self.engine) as session:
+            inserted = (await session.execute(stmt)).all()
+            await session.commit()
+        return {row.guild_id: row.id for row in inserted}
+
+    async def publish(self, event_key: str, deliveries: list[GuildDelivery]) -> list[DeliveryResult]:
+        """
+        Store the deliveries of an event, then send them right away. Failed deliveries stay in the outbox
+        and are retried by the worker. If the outbox can't be written, the deliveries are sent without it.
+
+        Parameters:
+        - event_key (str): Identifies the stream online event, e.g. broadcaster id and start time.
+        - deliveries (list[GuildDelivery]): The deliveries to store and send.
+
+        Returns:
+        - list[DeliveryResult]: The outcome of every delivery that was sent. Deliveries of an event that was
+          already published are left out.
+        """
+
+        try:
+            row_ids = await self.enqueue(event_key, deliveries)
+        except Exception as e:
+            # A notification that can't be stored is still better sent once than not at all
+            print(f'Failed to store notifications of {event_key} in the outbox, sending without retries: {e}')
+            return await fan_out(deliveries, self.concurrency, self.scheduler)
+        claimed = [(row_ids[d.guild_id], 0, 0, d) for d in deliveries if d.guild_id in row_ids]
+        return await self._dispatch(claimed)
+
+    async def drain_once(self) -> int:
+        """
+        Claim a batch of rows that are due and send them.
+
+        Returns:
+        - int: The number of rows that were claimed.
+        """
+
+        entry = NotificationOutboxEntry
+        due = (select(entry.id)
+               .where(entry.status == 'pending', entry.next_attempt_at <= func.now())
+               .order_by(entry.id)
+               .limit(self.batch_size)
+               .with_for_update(skip_locked=True))
+        claim = (update(entry)
+                 .where(entry.id.in_(due.scalar_subquery()))
+                 .values(next_attempt_at=func.now() + timedelta(seconds=self.lease))
+                 .returning(entry.id, entry.guild_id, entry.channel_id, entry.payload, entry.sent_count,
+                            entry.attempts)
+                 .execution_options(synchronize_session=False))
+        async with AsyncSession(self.engine) as session:
+            rows = (await session.execute(claim)).all()
+            await session.commit()
+
+        claimed = []
+        missing = []
+        for row in rows:
+            channel = self.resolve_channel(row.channel_id)
+            if channel is None:
+                missing.append((row.id, row.sent_count, row.attempts,
+                                DeliveryResult(row.guild_id, False, 0, Exception('Notification channel not found'))))
+                continue
+            messages = [deserialize_message(m) for m in row.payload][row.sent_count:]
+            claimed.append((row.id, row.sent_count, row.attempts, GuildDelivery(row.guild_id, channel, messages)))
+
+        if missing:
+            await self._record(missing)
+        await self._dispatch(claimed)
+        return len(rows)
+
+    async def purge(self) -> int:
+        """
+        Delete the rows that are done (sent, or failed after the last attempt) and older than the retention
+        period, a batch per statement so that no statement holds its locks for long.
+        Pending rows are never deleted.
+
+        Returns:
+        - int: The number of rows that were deleted.
+        """
+
+        entry = NotificationOutboxEntry
+        expired = (select(entry.id)
+                   .where(entry.status.in_(('sent', 'failed')), entry.created_at < func.now() - timedelta(seconds=self.retention))
+                   .limit(self.purge_batch_size))
+        purged = 0
+        while True:
+            async with AsyncSession(self.engine) as session:
+                deleted = (await session.execute(
+                    delete(entry).where(entry.id.in_(expired.scalar_subquery()))
+                    .execution_options(synchronize_session=False)
+                )).rowcount
+                await session.commit()
+            purged += deleted
+            if deleted < self.purge_batch_size:
+                return purged
+
+    async def run(self, poll_interval: float = 5.0, purge_interval: float = 3600.0):
+        """
+        Drain the outbox forever, back to back while there is a backlog and every `poll_interval` seconds
+        otherwise, and purge old sent and failed rows every `purge_interval` seconds. Errors are printed and the loop
+        carries on.
+
+        Parameters:
+        - poll_interval (float): Seconds to wait after the outbox ran dry.
+        - purge_interval (float): Seconds between two purges of the sent and failed rows.
+
+        Returns:
+        - None
+        """
+
+        loop = asyncio.get_running_loop()
+        next_purge = loop.time()
+        while True:
+            if loop.time() >= next_purge:
+                next_purge = loop.time() + purge_interval
+                try:
+                    purged = await self.purge()
+                    if purged:
+                        print(f'Purged {purged} sent or failed notification(s) from the outbox')
+                except Exception as e:
+                    print(f'Failed to purge notification outbox: {e}')
+            try:
+                claimed = await self.drain_once()
+            except Exception as e:
+                print(f'Failed to drain notification outbox: {e}')
+                claimed = 0
+            if claimed < self.batch_size:
+                await asyncio.sleep(poll_interval)
+
+    async def _dispatch(self, claimed: list[tuple[int, int, int, GuildDelivery]]) -> list[DeliveryResult]:
+        if not claimed:
+            return []
+        renew = asyncio.create_task(self._renew_lease([row_id for row_id, *_ in claimed]))
+        try:
+            results = await fan_out([delivery for *_, delivery in claimed], self.concurrency, self.scheduler)
+        finally:
+            renew.cancel()
+        try:
+            await self._record([(row_id, sent_before, attempts, result)
+                                for (row_id, sent_before, attempts, _), result in zip(claimed, results)])
+        except Exception as e:
+            # The rows come back once their lease runs out and their remaining messages are sent again
+            print(f'Failed to record notification outcomes: {e}')
+        return results
+
+    async def _renew_lease(self, row_ids: list[int]):
+        # Runs until cancelled, pushing the lease forward well before it runs out
+        entry = NotificationOutboxEntry
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                async with AsyncSession(self.engine) as session:
+                    await session.execute(
+                        update(entry)
+                        .where(entry.id.in_(row_ids), entry.status == 'pending')
+                        .values(next_attempt_at=func.now() + timedelta(seconds=self.lease))
+                        .execution_options(synchronize_session=False)
+                    )
+                    await session.commit()
+            except Exception as e:
+                print(f'Failed to renew the lease of {len(row_ids)} notification(s): {e}')
+
+    async def _record(self, outcomes: list[tuple[int, int, int, DeliveryResult]]):
+        # One UPDATE ... FROM (VALUES ...) per chunk instead of one UPDATE per row
+        rows = []
+        for row_id, sent_before, attempts, result in outcomes:
+            sent_count = sent_before + result.sent
+            if result.success:
+                rows.append((row_id, 'sent', attempts, sent_count, None, None))
+                continue
+            attempts += 1
+            if attempts >= self.max_attempts:
+                rows.append((row_id, 'failed', attempts, sent_count, str(result.error), None))
+            else:
+                rows.append((row_id, 'pending', attempts, sent_count, str(result.error), self.backoff(attempts)))
+
+        entry = NotificationOutboxEntry
+        async with AsyncSession(self.engine) as session:
+            for chunk in chunked(rows, OUTCOME_CHUNK_SIZE):
+                outcome = values(column('id', Integer), column('status', String), column('attempts', Integer),
+                                 column('sent_count', Integer), column('last_error', String),
+                                 column('retry_in', Float), name='outcome').data(chunk)
+                retry_in = cast(outcome.c.retry_in, Float)
+                await session.execute(
+                    update(entry)
+                    .where(entry.id == outcome.c.id)
+                    .values(status=outcome.c.status,
+                            attempts=outcome.c.attempts,
+                            sent_count=outcome.c.sent_count,
+                            last_error=cast(outcome.c.last_error, String),
+                            # Rows that are done keep their next_attempt_at, the others wait for their backoff
+                            next_attempt_at=case(
+                                (retry_in.is_(None), entry.next_attempt_at),
+                                else_=func.now() + func.make_interval(0, 0, 0, 0, 0, 0, retry_in)
+                            ))
+                    .execution_options(synchronize_session=False)
+                )
+            await session.commit()
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from typing import Callable, Iterable, Optional
+
+from twitchAPI.object.api import TwitchUser
+from twitchAPI.twitch import Twitch
+
+# Helix get_users accepts at most 100 ids per request
+HELIX_GET_USERS_BATCH_SIZE = 100
+
+
+class BroadcasterProfileCache:
+    """
+    TTL cache of Twitch broadcaster profiles keyed by broadcaster id, so that profile images used by
+    the SFW embed (and anything else that needs them) cost at most one Helix request per broadcaster per TTL.
+
+    Parameters:
+    - ttl (float): How long, in seconds, a fetched profile stays fresh.
+    - clock (Callable[[], float]): Monotonic clock used for expiry, overridable for testing.
+
+    Methods:
+    - get(twitch, broadcaster_id): Returns the cached profile, fetching it once if it is missing or stale.
+    - prefetch(twitch, broadcaster_ids): Fills the cache ahead of time in batches, e.g. for every tracked streamer.
+    - invalidate(broadcaster_id): Drops a single cached profile.
+    """
+
+    def __init__(self, ttl: float = 3600, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._profiles: dict[str, tuple[float, TwitchUser]] = {}
+        self._pending: dict[str, asyncio.Future] = {}
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def _get_fresh(self, broadcaster_id: str) -> Optional[TwitchUser]:
+        entry = self._profiles.get(broadcaster_id)
+        if entry is None:
+            return None
+        expires_at, profile = entry
+        if expires_at <= self._clock():
+            del self._profiles[broadcaster_id]
+            return None
+        return profile
+
+    def _store(self, broadcaster_id: str, profile: TwitchUser):
+        self._profiles[broadcaster_id] = (self._clock() + self.ttl, profile)
+
+    async def get(self, twitch: Twitch, broadcaster_id: str) -> Optional[TwitchUser]:
+        """
+        Get the profile of a broadcaster, hitting the Twitch API only if it is not cached or has expired.
+        Concurrent callers asking for the same broadcaster share a single request.
+
+        Parameters:
+        - twitch (Twitch): An instance of the Twitch class used to make API calls.
+        - broadcaster_id (str): The id of the broadcaster.
+
+        Returns:
+        - Optional[TwitchUser]: The broadcaster's profile, or None if Twitch does not know the id.
+        """
+
+        key = str(broadcaster_id)
+        profile = self._get_fresh(key)
+        if profile is not None:
+            return profile
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            profile = None
+            async for user in twitch.get_users(user_ids=[broadcaster_id]):
+                self._store(key, user)
+                profile = user
+            future.set_result(profile)
+            return profile
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting on it
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    async def prefetch(self, twitch: Twitch, broadcaster_ids: Iterable[str]) -> int:
+        """
+        Fill the cache for the given broadcasters ahead of time, skipping the ones that are still fresh.
+        Failures are printed and skipped, since a cold cache only costs a lookup later on.
+
+        Parameters:
+        - twitch (Twitch): An instance of the Twitch class used to make API calls.
+        - broadcaster_ids (Iterable[str]): The ids of the broadcasters to fetch.
+
+        Returns:
+        - int: The number of profiles that were fetched.
+        """
+
+        missing = [str(b) for b in dict.fromkeys(broadcaster_ids) if self._get_fresh(str(b)) is None]
+        fetched = 0
+        for i in range(0, len(missing), HELIX_GET_USERS_BATCH_SIZE):
+            batch = missing[i:i + HELIX_GET_USERS_BATCH_SIZE]
+            try:
+                async for user in twitch.get_users(user_ids=batch):
+                    self._store(str(user.id), user)
+                    fetched += 1
+            except Exception as e:
+                # Network errors included, a failed prefetch must never stop the startup
+                print(f'Failed to prefetch broadcaster profiles: {e}')
+        return fetched
+
+    def invalidate(self, broadcaster_id: str):
+        self._profiles.pop(str(broadcaster_id), None)
@@ -0,0 +1,219 @@
+import asyncio
+import time
+from typing import Callable, Hashable
+
+import discord
+from discord.ext import commands
+
+# Discord allows around 50 requests per second per bot across all routes
+DISCORD_GLOBAL_RATE = 50.0
+# Creating messages is limited to about 5 per 5 seconds per channel
+DISCORD_CHANNEL_RATE = 1.0
+DISCORD_CHANNEL_BURST = 5
+# Fallback wait when a 429 does not say how long to back off for, in seconds
+DEFAULT_RETRY_AFTER = 1.0
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out send slots at a steady rate with a bounded burst. Callers reserve a token
+    up front and sleep until it is theirs, so waiters are served in the order they arrived.
+
+    Parameters:
+    - rate (float): Tokens added per second.
+    - capacity (int): The maximum number of tokens, i.e. the burst size.
+    - clock (Callable[[], float]): Monotonic clock, overridable for testing.
+
+    Methods:
+    - reserve(): Takes a token and returns how long to wait before using it.
+    - acquire(): Takes a token and waits until it can be used.
+    - block_for(seconds): Stops handing out usable tokens for a while, e.g. after a 429.
+    """
+
+    def __init__(self, rate: float, capacity: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def is_idle(self) -> bool:
+        now = self._clock()
+        self._refill(now)
+        return self._tokens >= self.capacity and self._blocked_until <= now
+
+    def reserve(self) -> float:
+        now = self._clock()
+        self._refill(now)
+        self._tokens -= 1
+        wait = max(0.0, self._blocked_until - now)
+        if self._tokens < 0:
+            wait = max(wait, -self._tokens / self.rate)
+        return wait
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def block_for(self, seconds: float):
+        self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits how many sends are in flight, adjusting the limit from what Discord reports back
+    (additive increase, multiplicative decrease): a fast send grows the limit by one, a slow send
+    shrinks it by one and a 429 halves it.
+
+    Parameters:
+    - initial (int): The starting limit.
+    - minimum (int): The lowest the limit can go.
+    - maximum (int): The highest the limit can go.
+    - latency_threshold (float): Sends slower than this many seconds count as slow.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_threshold: float):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(self.maximum, max(self.minimum, initial))
+        self.latency_threshold = latency_threshold
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, latency: float | None, rate_limited: bool = False):
+        """
+        Free a slot and adjust the limit from the outcome of the send that held it.
+
+        Parameters:
+        - latency (float | None): How long the send took, or None if it failed for another reason.
+        - rate_limited (bool): Whether the send was answered with a 429.
+
+        Returns:
+        - None
+        """
+
+        async with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self.limit = max(self.minimum, self.limit // 2)
+            elif latency is not None and latency > self.latency_threshold:
+                self.limit = max(self.minimum, self.limit - 1)
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + 1)
+            self._condition.notify_all()
+
+
+class SendScheduler:
+    """
+    Paces every outbound Discord message of the bot, so that a notification burst or a busy command
+    channel waits its turn locally instead of running into 429s. Each send takes a token from the bucket of
+    its channel and from the global bucket, then a slot from the adaptive concurrency limiter. A 429 blocks
+    the channel for the time Discord asked for, halves the concurrency and the send is retried.
+
+    Parameters:
+    - global_rate (float): Sends per second across all channels.
+    - channel_rate (float): Sends per second per channel.
+    - channel_burst (int): How many sends a channel can make back to back.
+    - max_concurrency (int): The maximum number of sends in flight.
+    - min_concurrency (int): The minimum number of sends in flight the limiter can shrink to.
+    - latency_threshold (float): Sends slower than this many seconds shrink the concurrency.
+    - max_retries (int): How many times a rate limited send is retried before giving up.
+    - clock (Callable[[], float]): Monotonic clock, overridable for testing.
+
+    Methods:
+    - send(target, *args, **kwargs): Sends a message to a channel, user or command context.
+    """
+
+    # Drop idle channel buckets once there are this many, so the scheduler does not grow forever
+    MAX_IDLE_ROUTES = 10000
+
+    def __init__(self,
+                 global_rate: float = DISCORD_GLOBAL_RATE,
+                 channel_rate: float = DISCORD_CHANNEL_RATE,
+                 channel_burst: int = DISCORD_CHANNEL_BURST,
+                 max_concurrency: int = 25,
+                 min_concurrency: int = 1,
+                 latency_threshold: float = 2.0,
+                 max_retries: int = 3,
+                 clock: Callable[[], float] = time.monotonic):
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.max_retries = max_retries
+        self._clock = clock
+        self._global = TokenBucket(global_rate, max(1, int(global_rate)), clock)
+        self._routes: dict[Hashable, TokenBucket] = {}
+        self.limiter = AdaptiveConcurrencyLimiter(max_concurrency, min_concurrency, max_concurrency, latency_threshold)
+
+    @staticmethod
+    def route_key(target) -> Hashable:
+        # A command context replies in its channel, anything else (channel, member, user) is its own route
+        channel = getattr(target, 'channel', None) if isinstance(target, commands.Context) else None
+        target = channel or target
+        return getattr(target, 'id', None) or id(target)
+
+    def _route_bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self._routes.get(key)
+        if bucket is None:
+            if len(self._routes) >= self.MAX_IDLE_ROUTES:
+                self._routes = {k: b for k, b in self._routes.items() if not b.is_idle()}
+            bucket = TokenBucket(self.channel_rate, self.channel_burst, self._clock)
+            self._routes[key] = bucket
+        return bucket
+
+    @staticmethod
+    def _retry_after(error: Exception) -> float | None:
+        """
+        Get how long Discord asked us to back off for, or None if the error is not a rate limit.
+        """
+
+        if isinstance(error, discord.RateLimited):
+            return error.retry_after
+        if isinstance(error, discord.HTTPException) and error.status == 429:
+            headers = getattr(error.response, 'headers', None) or {}
+            try:
+                return float(headers.get('Retry-After', DEFAULT_RETRY_AFTER))
+            except (TypeError, ValueError):
+                return DEFAULT_RETRY_AFTER
+        return None
+
+    async def send(self, target: discord.abc.Messageable, *args, **kwargs):
+        """
+        Send a message once the rate limits allow it, retrying if Discord still answers with a 429.
+
+        Parameters:
+        - target (discord.abc.Messageable): Where to send the message (channel, user or command context).
+        - *args, **kwargs: Passed to target.send as is.
+
+        Returns:
+        - discord.Message: The message that was sent.
+        """
+
+        bucket = self._route_bucket(self.route_key(target))
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            await self._global.acquire()
+            await self.limiter.acquire()
+            start = self._clock()
+            try:
+                message = await target.send(*args, **kwargs)
+            except Exception as e:
+                retry_after = self._retry_after(e)
+                await self.limiter.release(None, rate_limited=retry_after is not None)
+                if retry_after is None or attempt == self.max_retries:
+                    raise
+                print(f'Rate limited sending to {self.route_key(target)}, retrying in {retry_after:.2f}s')
+                bucket.block_for(retry_after)
+                continue
+            await self.limiter.release(self._clock() - start)
+            return message
@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.models import Guild, UserSubscription
+
+
+@dataclass(frozen=True)
+class GuildConfig:
+    guild_id: int
+    notification_channel_id: int
+    notification_mode: str
+    is_censored: bool
+
+
+class SubscriptionIndex:
+    """
+    In-process index of who to notify when a streamer goes live, so that fan-out is a dictionary lookup
+    instead of a database round trip. It mirrors the guilds and user_subscriptions tables: it is loaded once
+    at startup and every handler that writes to those tables applies the same change here after committing.
+    Its guild configurations double as a write-through cache for permission checks and configuration reads.
+
+    Attributes:
+    - _guilds (dict[int, GuildConfig]): Notification configuration of every guild, keyed by guild id.
+    - _subscriptions (dict[int, dict[int, set[int]]]): Streamer id to guild id to the subscribed user ids.
+
+    Methods:
+    - load(session): Replaces the index contents with the current database state.
+    - get_guild(guild_id): Returns the configuration of a guild, None if it is unknown.
+    - set_guild(guild_id, notification_channel_id, notification_mode, is_censored): Adds or updates a guild.
+    - remove_guild(guild_id): Removes a guild and all of its subscriptions.
+    - add_subscriptions(guild_id, user_id, streamer_ids): Records new subscriptions of a user in a guild.
+    - remove_subscriptions(guild_id, user_id, streamer_ids): Forgets subscriptions of a user in a guild.
+    - lookup(streamer_id): Returns every guild to notify for a streamer along with its subscribed users.
+    """
+
+    def __init__(self):
+        self._guilds: dict[int, GuildConfig] = {}
+        self._subscriptions: dict[int, dict[int, set[int]]] = {}
+
+    async def load(self, session: AsyncSession):
+        """
+        Replace the contents of the index with the guilds and subscriptions currently in the database.
+        Subscribers are aggregated by the database, so one row is read per streamer and guild pair
+        rather than one per subscription.
+
+        Parameters:
+        - session (AsyncSession): The session used to read the guilds and user_subscriptions tables.
+
+        Returns:
+        - None
+        """
+
+        guilds = {}
+        for row in await session.execute(select(Guild.guild_id,
+                                                Guild.notification_channel_id,
+                                                Guild.notification_mode,
+                                                Guild.is_censored)):
+            guilds[row.guild_id] = GuildConfig(*row)
+
+        subscriptions = {}
+        for row in await session.execute(select(UserSubscription.streamer_id,
+                                                UserSubscription.guild_id,
+                                                func.array_agg(UserSubscription.user_id).label('user_ids'))
+                                         .group_by(UserSubscription.streamer_id, UserSubscription.guild_id)):
+            subscriptions.setdefault(row.streamer_id, {})[row.guild_id] = set(row.user_ids)
+
+        self._guilds = guilds
+        self._subscriptions = subscriptions
+
+    def get_guild(self, guild_id: int) -> Optional[GuildConfig]:
+        return self._guilds.get(guild_id)
+
+    def set_guild(self, guild_id: int, notification_channel_id: int, notification_mode: str, is_censored: bool):
+        self._guilds[guild_id] = GuildConfig(guild_id, notification_channel_id, notification_mode, is_censored)
+
+    def remove_guild(self, guild_id: int):
+        self._guilds.pop(guild_id, None)
+        for streamer_id in list(self._subscriptions):
+            guild_users = self._subscriptions[streamer_id]
+            guild_users.pop(guild_id, None)
+            if not guild_users:
+                del self._subscriptions[streamer_id]
+
+    def add_subscriptions(self, guild_id: int, user_id: int, streamer_ids: Iterable[int]):
+        for streamer_id in streamer_ids:
+            self._subscriptions.setdefault(streamer_id, {}).setdefault(guild_id, set()).add(user_id)
+
+    def remove_subscriptions(self, guild_id: int, user_id: int, streamer_ids: Iterable[int]):
+        for streamer_id in streamer_ids:
+            guild_users = self._subscriptions.get(streamer_id)
+            if guild_users is None or guild_id not in guild_users:
+                continue
+            guild_users[guild_id].discard(user_id)
+            if not guild_users[guild_id]:
+                del guild_users[guild_id]
+            if not guild_users:
+                del self._subscriptions[streamer_id]
+
+    def lookup(self, streamer_id: int) -> list[tuple[GuildConfig, frozenset[int]]]:
+        """
+        Get every guild that has at least one subscriber of the given streamer.
+
+        Parameters:
+        - streamer_id (int): The Twitch id of the streamer.
+
+        Returns:
+        - list[tuple[GuildConfig, frozenset[int]]]: Each guild's configuration with a snapshot of its subscribed
+          user ids. Guilds without a known configuration are left out.
+        """
+
+        return [
+            (self._guilds[guild_id], frozenset(user_ids))
+            for guild_id, user_ids in self._subscriptions.get(streamer_id, {}).items()
+            if guild_id in self._guilds
+        ]
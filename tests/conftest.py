@@ -1,57 +1,76 @@
 import os
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock
 
 import discord
 import pytest
+import pytest_asyncio
 from discord.ext.commands import Context, Bot
+from alembic import command
+from alembic.config import Config
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, event
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.pool import NullPool
 from twitchAPI.object.eventsub import StreamOnlineEvent, StreamOnlineData
 
-from bot.models import Base
-
 # Load dotenv if on local env (check for prod only env var)
 if not os.getenv('FLY_APP_NAME'):
     load_dotenv()
 postgres_test_connection_str = os.getenv('POSTGRESQL_TEST_URL')
+alembic_script_location = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'alembic')
+# The last revision the schema built by Base.metadata.create_all (before the fixture ran migrations) matches
+create_all_revision = '9e4c9ca49925'
 
 
 @pytest.fixture(scope='session')
 def test_engine():
+    # Build the schema with the migrations, create_all never alters tables that already exist
+    # so the test database would drift from production
+    config = Config()
+    config.set_main_option('script_location', alembic_script_location)
+    config.set_main_option('sqlalchemy.url', postgres_test_connection_str.replace('%', '%%'))
     engine = create_engine(postgres_test_connection_str, echo=True, pool_pre_ping=True, pool_recycle=300)
-    Base.metadata.create_all(engine)
+    tables = inspect(engine).get_table_names()
+    if 'guilds' in tables and 'alembic_version' not in tables:
+        # One-time migration of a test database built by create_all, stamp it so upgrade skips the tables it has
+        # (and keeps the rows the tests rely on) instead of failing to create them again
+        print(f'Test database has no alembic_version, stamping it at {create_all_revision}')
+        command.stamp(config, create_all_revision)
+    command.upgrade(config, 'head')
     yield engine
 
 
-@pytest.fixture(scope='function')
-def test_connection(test_engine):
-    connection = test_engine.connect()
+@pytest_asyncio.fixture(scope='function')
+async def test_async_engine(test_engine):
+    # NullPool so no connection outlives the event loop of the test that opened it
+    engine = create_async_engine(postgres_test_connection_str, echo=True, poolclass=NullPool)
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture(scope='function')
+async def test_connection(test_async_engine):
+    connection = await test_async_engine.connect()
     yield connection
-    connection.close()
+    await connection.close()
 
 
-@pytest.fixture(scope='function')
-def test_transaction(test_connection):
-    transaction = test_connection.begin()
+@pytest_asyncio.fixture(scope='function')
+async def test_transaction(test_connection):
+    transaction = await test_connection.begin()
     yield transaction
-    transaction.rollback()
+    await transaction.rollback()
 
 
-@pytest.fixture(scope='function')
-def test_session(test_transaction, test_connection):
-    session = sessionmaker(bind=test_connection)()
-    session.begin_nested()
-
-    @event.listens_for(session, 'after_transaction_end')
-    def restart_savepoint(_session, transaction):
-        if transaction.nested and not transaction._parent.nested:
-            _session.expire_all()
-            _session.begin_nested()
+@pytest_asyncio.fixture(scope='function')
+async def test_session(test_transaction, test_connection):
+    # Commits inside the code under test only release a savepoint,
+    # everything is rolled back with the outer transaction
+    session = AsyncSession(bind=test_connection, join_transaction_mode='create_savepoint')
 
     yield session
 
-    session.close()
+    await session.close()
 
 
 @pytest.fixture(scope='function')
@@ -62,6 +81,7 @@ def bot():
     bot_user.name = 'Bot'
     bot_instance = MagicMock(spec=Bot)
     bot_instance.user = bot_user
+    bot_instance.wait_until_ready = AsyncMock()
     return bot_instance
 
 
@@ -2,6 +2,7 @@ from datetime import datetime
 from unittest import mock
 
 import discord
+from bot.bot_ui import EmbedCreationContext, EventEmbedCache
 from bot.embed_strategies.draft import DraftEmbedStrategy
 from bot.embed_strategies.isis import IsisEmbedStrategy
 from bot.embed_strategies.prigozhin import PrigozhinEmbedStrategy
@@ -594,3 +595,44 @@ class TestCreateStreamsnipeSFWEmbed:
         )
 
         assert embed.title == f":rotating_light: {mock_stream_online_data.event.broadcaster_user_name} is LIVE! :rotating_light:"
+
+
+class TestEventEmbedCache:
+
+    def make_cache(self, mock_stream_online_data):
+        context = mock.MagicMock(spec=EmbedCreationContext)
+        context.create_embed.side_effect = lambda *args: mock.MagicMock(spec=discord.Embed)
+        sfw_context = mock.MagicMock(spec=EmbedCreationContext)
+        sfw_context.create_embed_custom_images.side_effect = lambda *args: mock.MagicMock(spec=discord.Embed)
+        cache = EventEmbedCache(context, sfw_context, mock_stream_online_data, 'Bot', 'bot_avatar_url')
+        return cache, context, sfw_context
+
+    #  Random strategy embed is rendered once and reused
+    def test_get_embed_renders_once(self, mock_stream_online_data):
+        cache, context, _ = self.make_cache(mock_stream_online_data)
+
+        assert cache.get_embed() is cache.get_embed()
+        context.create_embed.assert_called_once_with(mock_stream_online_data, 'Bot', 'bot_avatar_url')
+
+    #  Nothing is rendered until an embed is asked for
+    def test_embeds_are_lazy(self, mock_stream_online_data):
+        _, context, sfw_context = self.make_cache(mock_stream_online_data)
+
+        context.create_embed.assert_not_called()
+        sfw_context.create_embed_custom_images.assert_not_called()
+
+    #  SFW embed is rendered once per distinct guild icon
+    def test_get_sfw_embed_cached_per_icon(self, mock_stream_online_data):
+        cache, _, sfw_context = self.make_cache(mock_stream_online_data)
+
+        first_icon = cache.get_sfw_embed('https://example.com/a.png', 'https://example.com/profile.png')
+        same_icon = cache.get_sfw_embed('https://example.com/a.png', 'https://example.com/profile.png')
+        other_icon = cache.get_sfw_embed('https://example.com/b.png', 'https://example.com/profile.png')
+
+        assert first_icon is same_icon
+        assert first_icon is not other_icon
+        assert sfw_context.create_embed_custom_images.call_count == 2
+        sfw_context.create_embed_custom_images.assert_any_call(
+            mock_stream_online_data, 'Bot', 'bot_avatar_url', 'https://example.com/b.png',
+            'https://example.com/profile.png'
+        )
@@ -1,13 +1,15 @@
 from bot.bot_utils import validate_streamer_ids_get_names, streamer_get_ids_names_from_logins, \
-    get_first_sendable_text_channel, is_owner, is_owner_or_optin_mode
+    get_first_sendable_text_channel, is_owner, is_owner_or_optin_mode, get_guild_owner, minimal_intents
 from twitchAPI.twitch import Twitch
 from twitchAPI.type import TwitchAPIException
 from twitchAPI.object.api import TwitchUser
 from typing import AsyncGenerator
 import pytest
 import discord
+from unittest.mock import AsyncMock
 
 from bot.models import GetUsersStreamer
+from bot.subscription_index import GuildConfig
 
 
 @pytest.mark.asyncio
@@ -33,9 +35,9 @@ class TestStreamerGetIdsFromLogins:
 
         # Assert the result
         assert result == [
-            GetUsersStreamer(id='123', name='Broadcaster1'),
-            GetUsersStreamer(id='456', name='Broadcaster2'),
-            GetUsersStreamer(id='789', name='Broadcaster3')
+            GetUsersStreamer(id=123, name='Broadcaster1'),
+            GetUsersStreamer(id=456, name='Broadcaster2'),
+            GetUsersStreamer(id=789, name='Broadcaster3')
         ]
         mock_twitch.get_users.assert_called_once_with(logins=mock_logins)
 
@@ -86,7 +88,7 @@ class TestStreamerGetIdsFromLogins:
 
         # Assert the result
         assert result == [
-            GetUsersStreamer(id='123456789', name='Broadcaster')
+            GetUsersStreamer(id=123456789, name='Broadcaster')
         ]
         mock_twitch.get_users.assert_called_once_with(logins=mock_login)
 
@@ -114,9 +116,9 @@ class TestValidateStreamerIds:
 
         # Assert the result
         assert result == [
-            GetUsersStreamer(id='123', name='Streamer1'),
-            GetUsersStreamer(id='456', name='Streamer2'),
-            GetUsersStreamer(id='789', name='Streamer3')
+            GetUsersStreamer(id=123, name='Streamer1'),
+            GetUsersStreamer(id=456, name='Streamer2'),
+            GetUsersStreamer(id=789, name='Streamer3')
         ]
         mock_twitch.get_users.assert_called_once_with(user_ids=mock_ids)
 
@@ -137,7 +139,7 @@ class TestValidateStreamerIds:
 
         # Assert the result
         assert result == [
-            GetUsersStreamer(id='123', name='Streamer1'),
+            GetUsersStreamer(id=123, name='Streamer1'),
         ]
         mock_twitch.get_users.assert_called_once_with(user_ids=mock_id)
 
@@ -223,7 +225,7 @@ class TestIsOwner:
     def test_returns_true_if_interaction_user_is_guild_owner(self, mocker):
         interaction = mocker.Mock(spec=discord.Interaction)
         interaction.user.id = 123
-        interaction.guild.owner.id = 123
+        interaction.guild.owner_id = 123
 
         result = is_owner(interaction)
         assert result is True
@@ -232,7 +234,7 @@ class TestIsOwner:
     def test_returns_false_if_interaction_user_is_not_guild_owner(self, mocker):
         interaction = mocker.Mock(spec=discord.Interaction)
         interaction.user.id = 123
-        interaction.guild.owner.id = 456
+        interaction.guild.owner_id = 456
 
         result = is_owner(interaction)
         assert result is False
@@ -256,53 +258,105 @@ class TestIsOwner:
     #  Returns False if the guild owner is None.
     def test_returns_false_if_guild_owner_is_none(self, mocker):
         interaction = mocker.Mock(spec=discord.Interaction)
-        interaction.guild.owner = None
+        interaction.guild.owner_id = None
 
         result = is_owner(interaction)
         assert result is False
 
 
+class TestMinimalIntents:
+    def test_members_and_presences_are_not_requested(self):
+        intents = minimal_intents()
+
+        assert intents.guilds and intents.guild_messages and intents.message_content
+        assert not intents.members
+        assert not intents.presences
+
+
+@pytest.mark.asyncio
+class TestGetGuildOwner:
+    async def test_returns_cached_owner(self, mocker):
+        guild = mocker.MagicMock(spec=discord.Guild)
+        guild.fetch_member = AsyncMock()
+
+        assert await get_guild_owner(guild) is guild.owner
+        guild.fetch_member.assert_not_called()
+
+    async def test_fetches_owner_when_not_cached(self, mocker):
+        guild = mocker.MagicMock(spec=discord.Guild)
+        guild.owner = None
+        guild.owner_id = 123
+        guild.fetch_member = AsyncMock()
+
+        assert await get_guild_owner(guild) is guild.fetch_member.return_value
+        guild.fetch_member.assert_called_once_with(123)
+
+
 @pytest.mark.asyncio
 class TestIsOwnerOrOptinMode:
 
     # returns True if guild notification mode is 'optin' and author is not guild owner
-    async def test_optin_mode_not_owner(self, ctx, test_session, test_engine, mocker):
-        test_session.scalar = mocker.MagicMock(return_value='optin')
-        mocker.patch('bot.bot_utils.Session', return_value=test_session)
+    async def test_optin_mode_not_owner(self, ctx, test_session, test_async_engine, mocker):
+        test_session.scalar = mocker.AsyncMock(return_value='optin')
+        mocker.patch('bot.bot_utils.AsyncSession', return_value=test_session)
 
-        check_function = is_owner_or_optin_mode(test_engine).predicate
+        check_function = is_owner_or_optin_mode(test_async_engine).predicate
         result = await check_function(ctx)
 
         assert result is True
 
     # returns True if guild notification mode is not 'optin' and author is guild owner
-    async def test_global_mode_and_author_is_owner(self, ctx, test_session, test_engine, mocker):
-        ctx.guild.owner.id = ctx.author.id
-        test_session.scalar = mocker.MagicMock(return_value='global')
-        mocker.patch('bot.bot_utils.Session', return_value=test_session)
+    async def test_global_mode_and_author_is_owner(self, ctx, test_session, test_async_engine, mocker):
+        ctx.guild.owner_id = ctx.author.id
+        test_session.scalar = mocker.AsyncMock(return_value='global')
+        mocker.patch('bot.bot_utils.AsyncSession', return_value=test_session)
 
-        check_function = is_owner_or_optin_mode(test_engine).predicate
+        check_function = is_owner_or_optin_mode(test_async_engine).predicate
         result = await check_function(ctx)
 
         assert result is True
 
     # returns False if guild notification mode is not 'optin' and author is not guild owner
-    async def test_returns_false_if_not_optin_and_not_owner(self, ctx, test_session, test_engine, mocker):
-        test_session.scalar = mocker.MagicMock(return_value='passive')
-        mocker.patch('bot.bot_utils.Session', return_value=test_session)
+    async def test_returns_false_if_not_optin_and_not_owner(self, ctx, test_session, test_async_engine, mocker):
+        test_session.scalar = mocker.AsyncMock(return_value='passive')
+        mocker.patch('bot.bot_utils.AsyncSession', return_value=test_session)
 
-        check_function = is_owner_or_optin_mode(test_engine).predicate
+        check_function = is_owner_or_optin_mode(test_async_engine).predicate
         result = await check_function(ctx)
 
         assert result is False
 
     # returns True if guild notification mode is 'optin' and author is guild owner
-    async def test_optin_mode_and_owner(self, ctx, test_session, test_engine, mocker):
-        ctx.guild.owner.id = ctx.author.id
-        test_session.scalar = mocker.MagicMock(return_value='optin')
-        mocker.patch('bot.bot_utils.Session', return_value=test_session)
+    async def test_optin_mode_and_owner(self, ctx, test_session, test_async_engine, mocker):
+        ctx.guild.owner_id = ctx.author.id
+        test_session.scalar = mocker.AsyncMock(return_value='optin')
+        mocker.patch('bot.bot_utils.AsyncSession', return_value=test_session)
+
+        check_function = is_owner_or_optin_mode(test_async_engine).predicate
+        result = await check_function(ctx)
+
+        assert result is True
+
+    # the cached guild configuration is used without opening a session
+    @pytest.mark.parametrize('notification_mode, expected', [('optin', True), ('passive', False)])
+    async def test_cached_guild_config(self, ctx, test_async_engine, mocker, notification_mode, expected):
+        mock_session = mocker.patch('bot.bot_utils.AsyncSession')
+        guild_configs = mocker.MagicMock(return_value=GuildConfig(ctx.guild.id, 1, notification_mode, False))
+
+        check_function = is_owner_or_optin_mode(test_async_engine, guild_configs).predicate
+        result = await check_function(ctx)
+
+        assert result is expected
+        guild_configs.assert_called_once_with(ctx.guild.id)
+        mock_session.assert_not_called()
+
+    # guilds missing from the cache are read from the database
+    async def test_uncached_guild_config(self, ctx, test_session, test_async_engine, mocker):
+        test_session.scalar = mocker.AsyncMock(return_value='optin')
+        mocker.patch('bot.bot_utils.AsyncSession', return_value=test_session)
 
-        check_function = is_owner_or_optin_mode(test_engine).predicate
+        check_function = is_owner_or_optin_mode(test_async_engine, mocker.MagicMock(return_value=None)).predicate
         result = await check_function(ctx)
 
         assert result is True
+        test_session.scalar.assert_called_once()
@@ -0,0 +1,122 @@
+import pytest
+from sqlalchemy import select, event
+
+from bot.bulk_ops import bulk_update_topic_sub_ids, chunked, delete_orphaned_streamers, delete_user_subscriptions, \
+    insert_streamers, insert_user_subscriptions
+from bot.models import Streamer, UserSubscription
+
+
+def test_chunked():
+    assert list(chunked([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+    assert list(chunked([], 2)) == []
+
+
+@pytest.mark.asyncio
+class TestBulkUpdateTopicSubIds:
+    async def test_updates_every_row_with_one_statement_per_chunk(self, test_session, test_connection):
+        test_session.add_all([
+            Streamer(streamer_id=900000 + i, streamer_name=f'streamer{i}', topic_sub_id='old') for i in range(5)
+        ])
+        await test_session.flush()
+
+        updates = []
+
+        def count_updates(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE streamers'):
+                updates.append(statement)
+
+        event.listen(test_connection.sync_connection, 'before_cursor_execute', count_updates)
+        try:
+            statements = await bulk_update_topic_sub_ids(
+                test_session, {900000 + i: f'topic-{i}' for i in range(4)}, chunk_size=2)
+        finally:
+            event.remove(test_connection.sync_connection, 'before_cursor_execute', count_updates)
+
+        assert statements == 2
+        assert len(updates) == 2
+        assert 'FROM (VALUES' in updates[0]
+        topic_sub_ids = dict((await test_session.execute(
+            select(Streamer.streamer_id, Streamer.topic_sub_id).where(Streamer.streamer_id.between(900000, 900009))
+        )).all())
+        assert topic_sub_ids == {900000: 'topic-0', 900001: 'topic-1', 900002: 'topic-2',
+                                 900003: 'topic-3', 900004: 'old'}
+
+    async def test_nothing_to_update(self, test_session):
+        assert await bulk_update_topic_sub_ids(test_session, {}) == 0
+
+
+@pytest.mark.asyncio
+class TestInsertStreamers:
+    async def test_returns_only_inserted_streamers(self, test_session):
+        inserted = await insert_streamers(test_session, [
+            {'streamer_id': 433451304, 'streamer_name': 'a', 'topic_sub_id': 'new'},
+            {'streamer_id': 900000, 'streamer_name': 'streamer0', 'topic_sub_id': 'topic-0'},
+        ])
+
+        assert inserted == {900000}
+        # The existing streamer keeps its subscription
+        assert await test_session.scalar(
+            select(Streamer.topic_sub_id).where(Streamer.streamer_id == 433451304)) == 't1'
+
+    async def test_nothing_to_insert(self, test_session):
+        assert await insert_streamers(test_session, []) == set()
+
+
+@pytest.mark.asyncio
+class TestInsertUserSubscriptions:
+    async def test_skips_existing_subscriptions(self, test_session):
+        test_session.add(Streamer(streamer_id=900000, streamer_name='streamer0', topic_sub_id='topic-0'))
+        await test_session.flush()
+
+        inserted = await insert_user_subscriptions(test_session, 5, 1076360773879738380, [433451304, 900000])
+
+        assert inserted == {900000}
+        assert set((await test_session.scalars(select(UserSubscription.streamer_id).where(
+            UserSubscription.user_id == 5, UserSubscription.guild_id == 1076360773879738380))).all()) \
+            == {433451304, 900000}
+
+    async def test_nothing_to_insert(self, test_session):
+        assert await insert_user_subscriptions(test_session, 5, 1076360773879738380, []) == set()
+
+
+@pytest.mark.asyncio
+class TestDeleteUserSubscriptions:
+    async def test_deletes_given_streamers_only(self, test_session):
+        deleted = await delete_user_subscriptions(test_session, 5, 999, [433451304, 900000])
+
+        assert deleted == {433451304: 'a'}
+        assert (await test_session.scalars(select(UserSubscription.streamer_id).where(
+            UserSubscription.user_id == 5, UserSubscription.guild_id == 999))).all() == [162656602]
+
+    async def test_deletes_every_streamer_in_guild(self, test_session):
+        deleted = await delete_user_subscriptions(test_session, 5, 999)
+
+        assert deleted == {433451304: 'a', 162656602: 'b'}
+        # Subscriptions in other guilds are kept
+        assert (await test_session.scalars(
+            select(UserSubscription.guild_id).where(UserSubscription.user_id == 5))).all() == [1076360773879738380]
+
+    async def test_nothing_to_delete(self, test_session):
+        assert await delete_user_subscriptions(test_session, 5, 999, []) == {}
+
+
+@pytest.mark.asyncio
+class TestDeleteOrphanedStreamers:
+    async def test_deletes_only_streamers_without_subscriptions(self, test_session):
+        await delete_user_subscriptions(test_session, 5, 999)
+
+        orphaned = await delete_orphaned_streamers(test_session, [433451304, 162656602])
+
+        # 433451304 is still subscribed to in another guild
+        assert orphaned == {162656602: 't2'}
+        assert await test_session.get(Streamer, 162656602) is None
+        assert await test_session.get(Streamer, 433451304) is not None
+
+    async def test_checks_every_streamer_without_ids(self, test_session):
+        test_session.add(Streamer(streamer_id=900000, streamer_name='streamer0', topic_sub_id='topic-0'))
+        await test_session.flush()
+
+        assert await delete_orphaned_streamers(test_session) == {900000: 'topic-0'}
+
+    async def test_nothing_to_delete(self, test_session):
+        assert await delete_orphaned_streamers(test_session, []) == {}
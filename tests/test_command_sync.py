@@ -0,0 +1,67 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import discord
+import pytest
+from discord import app_commands
+from sqlalchemy import select
+
+from bot.command_sync import command_tree_fingerprint, sync_command_tree, COMMAND_TREE_FINGERPRINT_KEY
+from bot.models import BotSetting
+
+
+def make_tree(description='Get current streamers that you are getting notifications for.'):
+    client = MagicMock()
+    client._connection._command_tree = None
+    tree = app_commands.CommandTree(client)
+
+    @tree.command(name='notifs', description=description)
+    async def notifs(interaction: discord.Interaction):
+        pass
+
+    @tree.command(name='changeconfig', description='Change configuration of the bot server-wide.')
+    async def changeconfig(interaction: discord.Interaction, channel: discord.TextChannel):
+        pass
+
+    tree.sync = AsyncMock()
+    return tree
+
+
+class TestCommandTreeFingerprint:
+    def test_same_tree_same_fingerprint(self):
+        assert command_tree_fingerprint(make_tree()) == command_tree_fingerprint(make_tree())
+
+    def test_changed_description_changes_fingerprint(self):
+        assert command_tree_fingerprint(make_tree()) != command_tree_fingerprint(make_tree('Something else'))
+
+
+@pytest.mark.asyncio
+class TestSyncCommandTree:
+    @pytest.fixture(autouse=True)
+    def session(self, mocker, test_session):
+        # Both sessions of sync_command_tree run in the rolled back test transaction
+        mocker.patch('bot.command_sync.AsyncSession', return_value=test_session)
+        return test_session
+
+    async def test_syncs_when_fingerprint_is_unknown_then_skips(self, session):
+        tree = make_tree()
+
+        assert await sync_command_tree(tree, MagicMock()) is True
+        assert await sync_command_tree(tree, MagicMock()) is False
+
+        tree.sync.assert_called_once()
+        stored = await session.scalar(select(BotSetting.value).where(BotSetting.key == COMMAND_TREE_FINGERPRINT_KEY))
+        assert stored == command_tree_fingerprint(tree)
+
+    async def test_syncs_when_tree_changed(self):
+        await sync_command_tree(make_tree(), MagicMock())
+        changed = make_tree('Something else')
+
+        assert await sync_command_tree(changed, MagicMock()) is True
+        changed.sync.assert_called_once()
+
+    async def test_force_syncs_unchanged_tree(self):
+        tree = make_tree()
+        await sync_command_tree(tree, MagicMock())
+
+        assert await sync_command_tree(tree, MagicMock(), force=True) is True
+        assert tree.sync.call_count == 2
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+import pytest
+
+from bot.event_bridge import EventBridge
+
+
+@pytest.mark.asyncio
+class TestEventBridge:
+    async def test_jobs_run_in_submission_order(self):
+        bridge = EventBridge(maxsize=10, workers=1)
+        bridge.start()
+        ran = []
+
+        for i in range(5):
+            async def job(i=i):
+                ran.append(i)
+            await bridge.submit(job)
+        await bridge._queue.join()
+
+        assert ran == [0, 1, 2, 3, 4]
+        assert bridge.metrics().completed == 5
+        await bridge.stop()
+
+    async def test_failed_job_does_not_stop_worker(self, mocker):
+        mock_print = mocker.patch('builtins.print')
+        bridge = EventBridge(maxsize=10, workers=1)
+        bridge.start()
+        ran = []
+
+        async def broken():
+            raise Exception('boom')
+
+        async def ok():
+            ran.append(True)
+
+        await bridge.submit(broken)
+        await bridge.submit(ok)
+        await bridge._queue.join()
+
+        assert ran == [True]
+        metrics = bridge.metrics()
+        assert (metrics.completed, metrics.failed) == (1, 1)
+        mock_print.assert_called_with('Event job failed: boom')
+        await bridge.stop()
+
+    async def test_metrics_summary_is_printed_every_log_interval(self, mocker):
+        mock_print = mocker.patch('builtins.print')
+        now = 0.0
+        bridge = EventBridge(maxsize=10, workers=1, log_interval=60, clock=lambda: now)
+        bridge.start()
+
+        async def job():
+            pass
+
+        await bridge.submit(job)
+        await bridge._queue.join()
+        mock_print.assert_not_called()
+
+        now = 61.0
+        await bridge.submit(job)
+        await bridge._queue.join()
+
+        mock_print.assert_called_once_with(bridge.metrics().summary())
+        assert bridge.metrics().to_dict()['completed'] == 2
+        await bridge.stop()
+
+    async def test_submit_waits_when_full_and_warns_at_high_water(self, mocker):
+        mock_print = mocker.patch('builtins.print')
+        bridge = EventBridge(maxsize=2, workers=1, high_water_mark=1.0)
+        bridge.start()
+        release = asyncio.Event()
+
+        async def blocked():
+            await release.wait()
+
+        # One job is picked up by the worker, the next two fill the queue
+        for _ in range(3):
+            await bridge.submit(blocked)
+            await asyncio.sleep(0)
+        waiting = asyncio.create_task(bridge.submit(blocked))
+        await asyncio.sleep(0.01)
+
+        assert not waiting.done()
+        assert bridge.metrics().depth == 2
+        mock_print.assert_any_call('Event queue above high-water mark: 2/2 jobs waiting')
+
+        release.set()
+        await asyncio.wait_for(waiting, 1)
+        await bridge._queue.join()
+        metrics = bridge.metrics()
+        assert metrics.submitted == 4
+        assert metrics.max_depth == 2
+        assert metrics.max_wait > 0
+        await bridge.stop()
+
+    async def test_submit_from_another_loop(self):
+        bridge = EventBridge(maxsize=10, workers=2)
+        bridge.start()
+        done = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        async def job():
+            assert asyncio.get_running_loop() is loop
+            done.set()
+
+        # Same as the EventSub webhook, which runs its own loop in its own thread
+        thread = threading.Thread(target=lambda: asyncio.run(bridge.submit(job)))
+        thread.start()
+        await asyncio.wait_for(done.wait(), 1)
+        thread.join()
+        await bridge.stop()
+
+    async def test_submit_before_start_raises(self):
+        async def job():
+            pass
+
+        with pytest.raises(RuntimeError):
+            await EventBridge().submit(job)
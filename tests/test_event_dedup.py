@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from bot.event_dedup import TTLCache, EventDeduplicator
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    def test_check_and_add(self):
+        cache = TTLCache(max_size=10, ttl=60, clock=FakeClock())
+
+        assert cache.check_and_add('a') is False
+        assert cache.check_and_add('a') is True
+
+    def test_keys_expire_after_ttl(self):
+        clock = FakeClock()
+        cache = TTLCache(max_size=10, ttl=60, clock=clock)
+        cache.add('a')
+
+        clock.now = 60
+
+        assert 'a' not in cache
+        assert len(cache) == 0
+
+    def test_least_recently_seen_is_evicted_first(self):
+        clock = FakeClock()
+        cache = TTLCache(max_size=2, ttl=60, clock=clock)
+        cache.add('a')
+        clock.now = 1
+        cache.add('b')
+        clock.now = 2
+        cache.add('a')
+        clock.now = 3
+        cache.add('c')
+
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+
+    def test_discard(self):
+        cache = TTLCache(max_size=10, ttl=60, clock=FakeClock())
+        cache.add('a')
+
+        cache.discard('a')
+        cache.discard('unknown')
+
+        assert 'a' not in cache
+        assert len(cache) == 0
+
+
+class TestEventDeduplicator:
+    def test_duplicate_message_id(self):
+        dedup = EventDeduplicator(clock=FakeClock())
+
+        assert dedup.is_duplicate_message('msg-1') is False
+        assert dedup.is_duplicate_message('msg-1') is True
+        assert dedup.is_duplicate_message('msg-2') is False
+
+    def test_duplicate_event_by_broadcaster_and_start_time(self):
+        dedup = EventDeduplicator(clock=FakeClock())
+
+        assert dedup.is_duplicate_event(123, '2022-01-01 12:00:00') is False
+        assert dedup.is_duplicate_event('123', '2022-01-01 12:00:00') is True
+        assert dedup.is_duplicate_event('123', '2022-01-02 12:00:00') is False
+
+    def test_works_as_webhook_message_history(self):
+        dedup = EventDeduplicator(clock=FakeClock())
+
+        assert 'msg-1' not in dedup
+        dedup.append('msg-1')
+        assert 'msg-1' in dedup
+
+    def test_forget_event(self):
+        dedup = EventDeduplicator(clock=FakeClock())
+        dedup.is_duplicate_event('123', '2022-01-01 12:00:00')
+
+        dedup.forget_event(123, '2022-01-01 12:00:00')
+
+        assert dedup.is_duplicate_event('123', '2022-01-01 12:00:00') is False
+
+    @pytest.mark.asyncio
+    async def test_forget_event_forgets_message_id_of_its_delivery(self):
+        dedup = EventDeduplicator(clock=FakeClock())
+        forget = asyncio.Event()
+
+        async def callback(started_at):
+            await forget.wait()
+            if started_at == 'failed':
+                dedup.forget_event('123', started_at)
+
+        # Like EventSubWebhook: one task per request, which records the message id and creates the callback's task
+        async def handle(message_id, started_at):
+            dedup.append(message_id)
+            return asyncio.get_running_loop().create_task(callback(started_at))
+
+        tasks = [await asyncio.create_task(handle(message_id, started_at))
+                 for message_id, started_at in (('msg-1', 'failed'), ('msg-2', 'queued'))]
+        forget.set()
+        await asyncio.gather(*tasks)
+
+        assert 'msg-1' not in dedup
+        assert 'msg-2' in dedup
@@ -0,0 +1,191 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from twitchAPI.eventsub.webhook import EventSubWebhook
+from twitchAPI.object.eventsub import StreamOnlineEvent
+from twitchAPI.type import TwitchAPIException
+
+from bot.eventsub_sync import resubscribe_streamers, plan_subscriptions, apply_subscription_plan, SubscriptionPlan, \
+    unsubscribe_topics, adopt_subscription
+
+CALLBACK_URL = 'https://akula-bot.fly.dev/callback'
+
+
+async def callback(data):
+    pass
+
+
+@pytest.mark.asyncio
+class TestResubscribeStreamers:
+    async def test_respects_concurrency_limit(self):
+        in_flight = 0
+        peak = 0
+
+        async def listen_stream_online(streamer_id, cb):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return f'topic-{streamer_id}'
+
+        webhook = AsyncMock(spec=EventSubWebhook)
+        webhook.listen_stream_online.side_effect = listen_stream_online
+
+        report = await resubscribe_streamers(webhook, list(range(10)), callback, concurrency=3)
+
+        assert peak == 3
+        assert report.subscribed == {i: f'topic-{i}' for i in range(10)}
+        assert report.failed == {}
+
+    async def test_reports_failures_and_progress(self, mocker):
+        mock_print = mocker.patch('builtins.print')
+        error = Exception('Twitch API error')
+        webhook = AsyncMock(spec=EventSubWebhook)
+        webhook.listen_stream_online.side_effect = ['topic-1', error, 'topic-3']
+
+        report = await resubscribe_streamers(webhook, [1, 2, 3], callback, concurrency=1, progress_every=1)
+
+        assert report.subscribed == {1: 'topic-1', 3: 'topic-3'}
+        assert report.failed == {2: error}
+        mock_print.assert_any_call('Failed to subscribe to streamer 2: Twitch API error')
+        mock_print.assert_any_call('Subscribed 2/3 streamers...')
+
+
+@pytest.mark.asyncio
+class TestUnsubscribeTopics:
+    async def test_respects_concurrency_limit(self, mocker):
+        mocker.patch('builtins.print')
+        in_flight = 0
+        peak = 0
+
+        async def unsubscribe_topic(topic_sub_id):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return True
+
+        webhook = AsyncMock(spec=EventSubWebhook)
+        webhook.unsubscribe_topic.side_effect = unsubscribe_topic
+
+        failed = await unsubscribe_topics(webhook, {i: f'topic-{i}' for i in range(10)}, concurrency=3)
+
+        assert peak == 3
+        assert failed == []
+        assert webhook.unsubscribe_topic.await_count == 10
+
+    async def test_reports_failures(self, mocker):
+        mock_print = mocker.patch('builtins.print')
+        webhook = AsyncMock(spec=EventSubWebhook)
+        webhook.unsubscribe_topic.side_effect = [True, False, TwitchAPIException('Twitch API error')]
+
+        failed = await unsubscribe_topics(webhook, {1: 'topic-1', 2: 'topic-2', 3: 'topic-3'}, concurrency=1)
+
+        assert failed == [2, 3]
+        mock_print.assert_any_call('unsubbing topic topic-1 from streamer 1')
+        mock_print.assert_any_call('Failed to unsubscribe from streamer 2: the API did not confirm it')
+        mock_print.assert_any_call('Failed to unsubscribe from streamer 3: Twitch API error')
+
+
+def make_sub(sub_id, streamer_id, status='enabled', callback_url=CALLBACK_URL):
+    sub = MagicMock()
+    sub.id = sub_id
+    sub.status = status
+    sub.condition = {'broadcaster_user_id': streamer_id}
+    sub.transport = {'method': 'webhook', 'callback': callback_url}
+    return sub
+
+
+def make_twitch(subs):
+    async def listing():
+        for sub in subs:
+            yield sub
+
+    twitch = MagicMock()
+    twitch.get_eventsub_subscriptions = AsyncMock(return_value=listing())
+    twitch.delete_eventsub_subscription = AsyncMock()
+    return twitch
+
+
+def make_webhook():
+    webhook = MagicMock(spec=EventSubWebhook)
+    webhook._get_transport.return_value = {'method': 'webhook', 'callback': CALLBACK_URL, 'secret': 's'}
+    webhook._callbacks = {}
+    webhook._add_callback.side_effect = lambda c_id, cb, event: webhook._callbacks.__setitem__(
+        c_id, {'id': c_id, 'callback': cb, 'active': False, 'event': event})
+    webhook.listen_stream_online = AsyncMock(side_effect=lambda streamer_id, cb: f'new-{streamer_id}')
+    return webhook
+
+
+class TestAdoptSubscription:
+    # Runs against a real webhook: fails if an upgrade of twitchAPI drops the private attributes it relies on
+    def test_registers_subscription_on_real_webhook(self):
+        webhook = EventSubWebhook('https://akula-bot.fly.dev', 8080, MagicMock())
+
+        assert adopt_subscription(webhook, make_sub('sub-1', '1'), callback) is True
+        assert webhook._callbacks['sub-1'] == {'id': 'sub-1', 'callback': callback, 'active': True,
+                                               'event': StreamOnlineEvent}
+
+    def test_skips_subscription_of_another_callback(self):
+        webhook = EventSubWebhook('https://akula-bot.fly.dev', 8080, MagicMock())
+
+        assert adopt_subscription(webhook, make_sub('sub-1', '1', callback_url='https://elsewhere/callback'),
+                                  callback) is False
+        assert 'sub-1' not in webhook._callbacks
+
+
+@pytest.mark.asyncio
+class TestPlanSubscriptions:
+    async def test_classifies_subscriptions(self):
+        twitch = make_twitch([
+            make_sub('sub-1', '1'),
+            make_sub('sub-dup', '1'),
+            make_sub('sub-2', '2', status='notification_failures_exceeded'),
+            make_sub('sub-3', '3', callback_url='https://elsewhere/callback'),
+            make_sub('sub-gone', '99'),
+        ])
+        webhook = make_webhook()
+
+        plan = await plan_subscriptions(twitch, webhook, {1: 'sub-1', 2: 'sub-2', 3: 'sub-3', 4: None},
+                                        callback)
+
+        twitch.get_eventsub_subscriptions.assert_called_once_with(sub_type='stream.online')
+        assert plan.kept == {1: 'sub-1'}
+        assert plan.orphaned == ['sub-dup', 'sub-2', 'sub-3', 'sub-gone']
+        assert plan.missing == [2, 3, 4]
+        # Reused subscriptions are handled without subscribing again
+        assert webhook._callbacks['sub-1'] == {'id': 'sub-1', 'callback': callback, 'active': True,
+                                               'event': StreamOnlineEvent}
+        webhook.listen_stream_online.assert_not_called()
+
+
+@pytest.mark.asyncio
+class TestApplySubscriptionPlan:
+    async def test_deletes_orphans_and_creates_missing(self):
+        twitch = make_twitch([])
+        webhook = make_webhook()
+        plan = SubscriptionPlan(kept={1: 'sub-1', 5: 'sub-5'}, orphaned=['sub-2', 'sub-gone'], missing=[2])
+
+        report = await apply_subscription_plan(twitch, webhook, plan, {1: 'sub-1', 2: 'sub-2', 5: 'old-5'},
+                                               callback)
+
+        assert sorted(c.args[0] for c in twitch.delete_eventsub_subscription.mock_calls) == ['sub-2', 'sub-gone']
+        webhook.listen_stream_online.assert_called_once_with('2', callback)
+        # Only ids that differ from the DB are written back
+        assert report.topic_sub_ids == {5: 'sub-5', 2: 'new-2'}
+        assert sorted(report.deleted) == ['sub-2', 'sub-gone']
+        assert report.failed == {}
+
+    async def test_failed_delete_is_reported(self, mocker):
+        mock_print = mocker.patch('builtins.print')
+        twitch = make_twitch([])
+        twitch.delete_eventsub_subscription.side_effect = TwitchAPIException('Not Found')
+        plan = SubscriptionPlan(orphaned=['sub-gone'])
+
+        report = await apply_subscription_plan(twitch, make_webhook(), plan, {}, callback)
+
+        assert report.deleted == []
+        mock_print.assert_called_once_with('Failed to delete EventSub subscription sub-gone: Not Found')
@@ -0,0 +1,90 @@
+import asyncio
+from unittest.mock import AsyncMock, call
+
+import discord
+import pytest
+
+from bot.fanout import GuildDelivery, fan_out, deliver
+from bot.send_scheduler import SendScheduler
+
+
+@pytest.mark.asyncio
+class TestDeliver:
+    async def test_deliver_sends_messages_in_order(self, mocker):
+        channel = mocker.MagicMock(spec=discord.TextChannel)
+        channel.send = AsyncMock()
+        embed = mocker.MagicMock(spec=discord.Embed)
+
+        result = await deliver(GuildDelivery(1, channel, [{'embed': embed}, {'content': '<@1>'}]))
+
+        assert channel.send.mock_calls == [call(embed=embed), call(content='<@1>')]
+        assert result.success
+        assert result.sent == 2
+        assert result.error is None
+
+    async def test_deliver_stops_at_first_failure(self, mocker):
+        channel = mocker.MagicMock(spec=discord.TextChannel)
+        error = Exception('Missing Access')
+        channel.send = AsyncMock(side_effect=[None, error])
+
+        result = await deliver(
+            GuildDelivery(1, channel, [{'content': 'a'}, {'content': 'b'}, {'content': 'c'}]))
+
+        assert channel.send.call_count == 2
+        assert not result.success
+        assert result.sent == 1
+        assert result.error is error
+
+
+@pytest.mark.asyncio
+class TestFanOut:
+    async def test_fan_out_reports_each_guild(self, mocker):
+        ok_channel = mocker.MagicMock(spec=discord.TextChannel)
+        ok_channel.send = AsyncMock()
+        broken_channel = mocker.MagicMock(spec=discord.TextChannel)
+        broken_channel.send = AsyncMock(side_effect=Exception('Forbidden'))
+
+        results = await fan_out([
+            GuildDelivery(1, broken_channel, [{'content': 'a'}]),
+            GuildDelivery(2, ok_channel, [{'content': 'a'}]),
+        ], concurrency=5)
+
+        assert [(r.guild_id, r.success) for r in results] == [(1, False), (2, True)]
+        ok_channel.send.assert_called_once_with(content='a')
+
+    async def test_fan_out_respects_concurrency_limit(self, mocker):
+        in_flight = 0
+        peak = 0
+
+        async def slow_send(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+        deliveries = []
+        for i in range(10):
+            channel = mocker.MagicMock(spec=discord.TextChannel)
+            channel.send = AsyncMock(side_effect=slow_send)
+            deliveries.append(GuildDelivery(i, channel, [{'content': 'a'}]))
+
+        results = await fan_out(deliveries, concurrency=3)
+
+        assert peak == 3
+        assert all(r.success for r in results)
+
+    async def test_fan_out_no_deliveries(self):
+        assert await fan_out([], concurrency=5) == []
+
+    async def test_fan_out_sends_through_scheduler(self, mocker):
+        channel = mocker.MagicMock(spec=discord.TextChannel)
+        channel.send = AsyncMock()
+        scheduler = mocker.MagicMock(spec=SendScheduler)
+        scheduler.send = AsyncMock()
+
+        results = await fan_out([GuildDelivery(1, channel, [{'content': 'a'}])], concurrency=5, scheduler=scheduler)
+
+        scheduler.send.assert_called_once_with(channel, content='a')
+        channel.send.assert_not_called()
+        assert results[0].success
@@ -0,0 +1,154 @@
+from unittest.mock import MagicMock
+
+import pytest
+import twitchAPI
+from aiohttp.test_utils import TestClient, TestServer
+from twitchAPI.eventsub.webhook import EventSubWebhook
+
+from bot.health import StartupTracker, serve_health_checks
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestStartupTracker:
+    def test_stage_duration_is_time_since_previous_mark(self, mocker):
+        mocker.patch('builtins.print')
+        clock = FakeClock()
+        startup = StartupTracker(('db', 'twitch'), clock=clock)
+
+        clock.now = 2
+        startup.mark('db')
+        clock.now = 5
+        startup.mark('twitch')
+
+        assert startup.timings == {'db': 2, 'twitch': 3}
+        assert startup.ready
+
+    def test_not_ready_until_every_stage_is_done(self, mocker):
+        mocker.patch('builtins.print')
+        startup = StartupTracker(('db', 'twitch'), clock=FakeClock())
+
+        startup.mark('db')
+
+        assert not startup.ready
+        assert startup.pending() == ['twitch']
+
+    def test_marking_twice_keeps_first_timing(self, mocker):
+        mocker.patch('builtins.print')
+        clock = FakeClock()
+        startup = StartupTracker(('db',), clock=clock)
+        clock.now = 1
+        startup.mark('db')
+
+        clock.now = 10
+        startup.mark('db')
+
+        assert startup.timings == {'db': 1}
+
+    def test_unknown_stage(self):
+        startup = StartupTracker(('db',), clock=FakeClock())
+
+        with pytest.raises(ValueError):
+            startup.mark('cache')
+
+
+@pytest.mark.asyncio
+class TestServeHealthChecks:
+    @staticmethod
+    async def client_for(startup, alive=None, metrics=None):
+        webhook = EventSubWebhook('https://example.com', 8080, MagicMock())
+        serve_health_checks(webhook, startup, alive, metrics)
+        runner = webhook._EventSubWebhook__build_runner()
+        client = TestClient(TestServer(runner.app))
+        await client.start_server()
+        return client
+
+    async def test_readyz_reports_pending_stages(self, mocker):
+        mocker.patch('builtins.print')
+        startup = StartupTracker(('db', 'twitch'), clock=FakeClock())
+        startup.mark('db')
+        client = await self.client_for(startup)
+
+        try:
+            response = await client.get('/readyz')
+            body = await response.json()
+        finally:
+            await client.close()
+
+        assert response.status == 503
+        assert body['ready'] is False
+        assert body['pending'] == ['twitch']
+        assert body['stages'] == {'db': 0}
+
+    async def test_readyz_once_ready(self, mocker):
+        mocker.patch('builtins.print')
+        startup = StartupTracker(('db',), clock=FakeClock())
+        startup.mark('db')
+        client = await self.client_for(startup)
+
+        try:
+            response = await client.get('/readyz')
+        finally:
+            await client.close()
+
+        assert response.status == 200
+
+    async def test_readyz_includes_metrics(self, mocker):
+        mocker.patch('builtins.print')
+        startup = StartupTracker(('db',), clock=FakeClock())
+        startup.mark('db')
+        client = await self.client_for(startup, metrics=lambda: {'event_queue': {'depth': 3}})
+
+        try:
+            response = await client.get('/readyz')
+            body = await response.json()
+        finally:
+            await client.close()
+
+        assert body['event_queue'] == {'depth': 3}
+        assert body['ready'] is True
+
+    async def test_healthz_follows_alive_check(self):
+        startup = StartupTracker(('db',), clock=FakeClock())
+        alive = MagicMock(return_value=True)
+        client = await self.client_for(startup, alive)
+
+        try:
+            healthy = await client.get('/healthz')
+            alive.return_value = False
+            unhealthy = await client.get('/healthz')
+            callback = await client.get('/')
+        finally:
+            await client.close()
+
+        assert healthy.status == 200
+        assert unhealthy.status == 503
+        # The webhook's own routes are still served
+        assert callback.status == 200
+
+    async def test_webhook_start_builds_runner_with_health_checks(self, mocker):
+        # Pinned to the twitchAPI version serve_health_checks was written against, review the private
+        # __build_runner it wraps when upgrading
+        assert twitchAPI.VERSION[:3] == (4, 2, 0)
+        webhook = EventSubWebhook('https://example.com', 8080, MagicMock())
+        serve_health_checks(webhook, StartupTracker(('db',)))
+        mock_thread = mocker.patch('twitchAPI.eventsub.webhook.threading.Thread')
+        mock_thread.return_value.start.side_effect = lambda: setattr(webhook, '_startup_complete', True)
+
+        webhook.start()
+
+        runner = mock_thread.call_args.kwargs['args'][0]
+        paths = {route.resource.canonical for route in runner.app.router.routes()}
+        assert {'/healthz', '/readyz', '/callback'} <= paths
+
+    async def test_missing_build_runner_raises(self):
+        webhook = MagicMock(spec=[])
+
+        with pytest.raises(RuntimeError, match='does not support the installed twitchAPI version'):
+            serve_health_checks(webhook, StartupTracker(('db',)))
@@ -0,0 +1,77 @@
+import discord
+import pytest
+
+from bot.message_planner import chunk_mentions, plan_notification_messages, DISCORD_MESSAGE_LIMIT, \
+    GLOBAL_ALLOWED_MENTIONS, OPTIN_ALLOWED_MENTIONS, PASSIVE_ALLOWED_MENTIONS, MISSING_MENTION_EVERYONE_WARNING
+
+
+class TestChunkMentions:
+
+    def test_no_users(self):
+        assert chunk_mentions([]) == []
+
+    def test_single_chunk(self):
+        assert chunk_mentions(['1', '2', '3']) == ['<@1> <@2> <@3>']
+
+    def test_splits_at_limit(self):
+        user_ids = [str(10 ** 17 + i) for i in range(300)]
+
+        chunks = chunk_mentions(user_ids)
+
+        assert all(len(chunk) <= DISCORD_MESSAGE_LIMIT for chunk in chunks)
+        assert ' '.join(chunks).split(' ') == [f'<@{user_id}>' for user_id in user_ids]
+        # 300 mentions of 21 characters plus separators need 4 messages at the 2000 character limit
+        assert len(chunks) == 4
+
+    def test_exact_fit(self):
+        assert chunk_mentions(['1', '2'], limit=9) == ['<@1> <@2>']
+        assert chunk_mentions(['1', '2'], limit=8) == ['<@1>', '<@2>']
+
+
+class TestPlanNotificationMessages:
+
+    @pytest.fixture
+    def embed(self):
+        return discord.Embed(title='live')
+
+    def test_passive(self, embed):
+        assert plan_notification_messages('passive', embed, ['1'], True) == [
+            {'embed': embed, 'allowed_mentions': PASSIVE_ALLOWED_MENTIONS}
+        ]
+
+    def test_global_with_permission(self, embed):
+        assert plan_notification_messages('global', embed, ['1'], True) == [
+            {'content': '@everyone', 'embed': embed, 'allowed_mentions': GLOBAL_ALLOWED_MENTIONS}
+        ]
+
+    def test_global_without_permission(self, embed):
+        assert plan_notification_messages('global', embed, ['1'], False) == [
+            {'content': f'{MISSING_MENTION_EVERYONE_WARNING}\n@here', 'embed': embed,
+             'allowed_mentions': GLOBAL_ALLOWED_MENTIONS}
+        ]
+
+    def test_optin_merges_embed_and_mentions(self, embed):
+        assert plan_notification_messages('optin', embed, {'2', '1'}, False) == [
+            {'content': '<@1> <@2>', 'embed': embed, 'allowed_mentions': OPTIN_ALLOWED_MENTIONS}
+        ]
+
+    def test_optin_long_mention_list(self, embed):
+        user_ids = [str(10 ** 17 + i) for i in range(300)]
+
+        messages = plan_notification_messages('optin', embed, user_ids, False)
+
+        assert len(messages) == 4
+        assert messages[0]['embed'] is embed
+        assert all('embed' not in message for message in messages[1:])
+        assert all(len(message['content']) <= DISCORD_MESSAGE_LIMIT for message in messages)
+        assert all(message['allowed_mentions'] is OPTIN_ALLOWED_MENTIONS for message in messages)
+
+    def test_optin_without_users(self, embed):
+        assert plan_notification_messages('optin', embed, [], False) == [
+            {'embed': embed, 'allowed_mentions': OPTIN_ALLOWED_MENTIONS}
+        ]
+
+    def test_allowed_mentions(self):
+        assert GLOBAL_ALLOWED_MENTIONS.everyone and not GLOBAL_ALLOWED_MENTIONS.users
+        assert OPTIN_ALLOWED_MENTIONS.users and not OPTIN_ALLOWED_MENTIONS.everyone
+        assert not PASSIVE_ALLOWED_MENTIONS.everyone and not PASSIVE_ALLOWED_MENTIONS.users
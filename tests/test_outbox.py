@@ -0,0 +1,216 @@
+import asyncio
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import discord
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, event, select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.fanout import GuildDelivery
+from bot.message_planner import OPTIN_ALLOWED_MENTIONS
+from bot.models import NotificationOutboxEntry
+from bot.outbox import NotificationOutbox, serialize_message, deserialize_message
+from bot.send_scheduler import SendScheduler
+
+
+def make_channel(channel_id, side_effect=None):
+    channel = MagicMock(spec=discord.TextChannel)
+    channel.id = channel_id
+    channel.send = AsyncMock(side_effect=side_effect)
+    return channel
+
+
+@pytest_asyncio.fixture
+async def clean_outbox(test_async_engine):
+    async with AsyncSession(test_async_engine) as session:
+        await session.execute(delete(NotificationOutboxEntry))
+        await session.commit()
+    yield test_async_engine
+    async with AsyncSession(test_async_engine) as session:
+        await session.execute(delete(NotificationOutboxEntry))
+        await session.commit()
+
+
+async def get_entries(engine):
+    async with AsyncSession(engine) as session:
+        return (await session.scalars(select(NotificationOutboxEntry).order_by(NotificationOutboxEntry.id))).all()
+
+
+async def make_due(engine):
+    async with AsyncSession(engine) as session:
+        await session.execute(update(NotificationOutboxEntry).values(next_attempt_at=func.now()))
+        await session.commit()
+
+
+class TestSerialization:
+    def test_round_trip(self):
+        embed = discord.Embed(title='Live!', url='https://twitch.tv/test')
+        message = {'content': '<@1>', 'embed': embed, 'allowed_mentions': OPTIN_ALLOWED_MENTIONS}
+
+        restored = deserialize_message(serialize_message(message))
+
+        assert restored['content'] == '<@1>'
+        assert restored['embed'].to_dict() == embed.to_dict()
+        assert restored['allowed_mentions'].to_dict() == OPTIN_ALLOWED_MENTIONS.to_dict()
+
+
+
+class TestBackoff:
+    def test_backoff_doubles_up_to_max(self):
+        outbox = NotificationOutbox(MagicMock(), MagicMock(), MagicMock(), concurrency=5,
+                                    base_backoff=5, max_backoff=30)
+
+        assert [outbox.backoff(n) for n in range(1, 6)] == [5, 10, 20, 30, 30]
+
+
+@pytest.mark.asyncio
+class TestNotificationOutbox:
+    async def test_publish_sends_and_marks_sent(self, clean_outbox):
+        channel = make_channel(10)
+        outbox = NotificationOutbox(clean_outbox, SendScheduler(), lambda _: channel, concurrency=5)
+
+        results = await outbox.publish('123:now', [GuildDelivery(1, channel, [{'content': 'a'}])])
+
+        assert [r.success for r in results] == [True]
+        channel.send.assert_called_once_with(content='a')
+        [entry] = await get_entries(clean_outbox)
+        assert entry.idempotency_key == '123:now:1'
+        assert entry.status == 'sent'
+        assert entry.sent_count == 1
+
+    async def test_publish_same_event_twice_sends_once(self, clean_outbox):
+        channel = make_channel(10)
+        outbox = NotificationOutbox(clean_outbox, SendScheduler(), lambda _: channel, concurrency=5)
+        deliveries = [GuildDelivery(1, channel, [{'content': 'a'}])]
+
+        await outbox.publish('123:now', deliveries)
+        results = await outbox.publish('123:now', deliveries)
+
+        assert results == []
+        channel.send.assert_called_once()
+        assert len(await get_entries(clean_outbox)) == 1
+
+    async def test_failed_delivery_is_retried_from_where_it_stopped(self, clean_outbox):
+        channel = make_channel(10, side_effect=[None, Exception('Service Unavailable'), None])
+        outbox = NotificationOutbox(clean_outbox, SendScheduler(), lambda _: channel, concurrency=5)
+
+        results = await outbox.publish('123:now', [
+            GuildDelivery(1, channel, [{'content': 'a'}, {'content': 'b'}])
+        ])
+
+        assert not results[0].success
+        [entry] = await get_entries(clean_outbox)
+        assert entry.status == 'pending'
+        assert entry.attempts == 1
+        assert entry.sent_count == 1
+        assert entry.last_error == 'Service Unavailable'
+
+        # Not due until the backoff has passed
+        assert await outbox.drain_once() == 0
+        await make_due(clean_outbox)
+        assert await outbox.drain_once() == 1
+
+        assert [c.kwargs['content'] for c in channel.send.mock_calls] == ['a', 'b', 'b']
+        [entry] = await get_entries(clean_outbox)
+        assert entry.status == 'sent'
+        assert entry.sent_count == 2
+
+    async def test_gives_up_after_max_attempts(self, clean_outbox):
+        channel = make_channel(10, side_effect=Exception('Forbidden'))
+        outbox = NotificationOutbox(clean_outbox, SendScheduler(), lambda _: channel, concurrency=5,
+                                    max_attempts=2)
+
+        await outbox.publish('123:now', [GuildDelivery(1, channel, [{'content': 'a'}])])
+        await make_due(clean_outbox)
+        await outbox.drain_once()
+
+        [entry] = await get_entries(clean_outbox)
+        assert entry.status == 'failed'
+        assert entry.attempts == 2
+        await make_due(clean_outbox)
+        assert await outbox.drain_once() == 0
+
+    async def test_drain_with_missing_channel_counts_as_attempt(self, clean_outbox):
+        channel = make_channel(10, side_effect=Exception('Service Unavailable'))
+        outbox = NotificationOutbox(clean_outbox, SendScheduler(), lambda _: None, concurrency=5)
+
+        await outbox.publish('123:now', [GuildDelivery(1, channel, [{'content': 'a'}])])
+        await make_due(clean_outbox)
+        await outbox.drain_once()
+
+        [entry] = await get_entries(clean_outbox)
+        assert entry.attempts == 2
+        assert entry.last_error == 'Notification channel not found'
+
+    async def test_publish_sends_directly_when_outbox_cannot_be_written(self, clean_outbox, mocker):
+        mocker.patch('builtins.print')
+        channel = make_channel(10)
+        outbox = NotificationOutbox(clean_outbox, SendScheduler(), lambda _: channel, concurrency=5)
+        outbox.enqueue = AsyncMock(side_effect=ConnectionError('connection refused'))
+
+        results = await outbox.publish('123:now', [GuildDelivery(1, channel, [{'content': 'a'}])])
+
+        assert [r.success for r in results] == [True]
+        channel.send.assert_called_once_with(content='a')
+
+    async def test_outcomes_are_recorded_with_one_statement(self, clean_outbox):
+        channels = [make_channel(10), make_channel(11, side_effect=Exception('Forbidden')), make_channel(12)]
+        outbox = NotificationOutbox(clean_outbox, SendScheduler(), lambda _: None, concurrency=5, max_attempts=1)
+        updates = []
+
+        def count_updates(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE notification_outbox'):
+                updates.append(statement)
+
+        event.listen(clean_outbox.sync_engine, 'before_cursor_execute', count_updates)
+        try:
+            await outbox.publish('123:now', [GuildDelivery(i, c, [{'content': 'a'}]) for i, c in enumerate(channels)])
+        finally:
+            event.remove(clean_outbox.sync_engine, 'before_cursor_execute', count_updates)
+
+        assert len(updates) == 1
+        assert [(e.status, e.attempts, e.last_error) for e in await get_entries(clean_outbox)] == [
+            ('sent', 0, None), ('failed', 1, 'Forbidden'), ('sent', 0, None)
+        ]
+
+    async def test_lease_is_renewed_while_sending(self, clean_outbox):
+        async def slow_send(**kwargs):
+            await asyncio.sleep(1)
+
+        channel = make_channel(10, side_effect=slow_send)
+        outbox = NotificationOutbox(clean_outbox, SendScheduler(), lambda _: channel, concurrency=5, lease=0.3)
+        other_sender = NotificationOutbox(clean_outbox, SendScheduler(), lambda _: channel, concurrency=5)
+
+        publish = asyncio.create_task(outbox.publish('123:now', [GuildDelivery(1, channel, [{'content': 'a'}])]))
+        await asyncio.sleep(0.6)
+        # Well past the first lease, the row is still being sent and must not be claimed again
+        assert await other_sender.drain_once() == 0
+        await publish
+
+        channel.send.assert_called_once()
+        [entry] = await get_entries(clean_outbox)
+        assert entry.status == 'sent'
+
+    async def test_purge_deletes_only_old_sent_and_failed_rows(self, clean_outbox):
+        channel = make_channel(10)
+        outbox = NotificationOutbox(clean_outbox, SendScheduler(), lambda _: channel, concurrency=5,
+                                    retention=3600, purge_batch_size=2)
+        for key in ('old', 'old2', 'old3', 'new'):
+            await outbox.publish(key, [GuildDelivery(1, channel, [{'content': 'a'}])])
+        for key in ('pending', 'failed', 'new-failed'):
+            await outbox.enqueue(key, [GuildDelivery(1, channel, [{'content': 'a'}])])
+        async with AsyncSession(clean_outbox) as session:
+            await session.execute(update(NotificationOutboxEntry)
+                                  .where(NotificationOutboxEntry.idempotency_key.in_(['failed:1', 'new-failed:1']))
+                                  .values(status='failed'))
+            await session.execute(update(NotificationOutboxEntry)
+                                  .where(NotificationOutboxEntry.idempotency_key.not_in(['new:1', 'new-failed:1']))
+                                  .values(created_at=func.now() - timedelta(days=1)))
+            await session.commit()
+
+        assert await outbox.purge() == 4
+
+        assert [e.idempotency_key for e in await get_entries(clean_outbox)] == ['new:1', 'pending:1',
+                                                                                 'new-failed:1']
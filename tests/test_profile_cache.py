@@ -0,0 +1,113 @@
+import asyncio
+
+import aiohttp
+
+import pytest
+from twitchAPI.type import TwitchAPIException
+
+from bot.profile_cache import BroadcasterProfileCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_twitch(mocker, users_by_id):
+    async def get_users(user_ids):
+        await asyncio.sleep(0)
+        for user_id in user_ids:
+            if user_id in users_by_id:
+                yield users_by_id[user_id]
+
+    twitch = mocker.MagicMock()
+    twitch.get_users = mocker.MagicMock(side_effect=get_users)
+    return twitch
+
+
+def make_user(mocker, user_id):
+    user = mocker.MagicMock()
+    user.id = user_id
+    user.profile_image_url = f'https://example.com/{user_id}.png'
+    return user
+
+
+@pytest.mark.asyncio
+class TestBroadcasterProfileCache:
+    async def test_get_fetches_once_then_hits_cache(self, mocker):
+        user = make_user(mocker, '1')
+        twitch = make_twitch(mocker, {'1': user})
+        cache = BroadcasterProfileCache(ttl=60)
+
+        assert await cache.get(twitch, '1') is user
+        assert await cache.get(twitch, '1') is user
+        twitch.get_users.assert_called_once_with(user_ids=['1'])
+
+    async def test_get_refetches_after_ttl(self, mocker):
+        clock = FakeClock()
+        twitch = make_twitch(mocker, {'1': make_user(mocker, '1')})
+        cache = BroadcasterProfileCache(ttl=60, clock=clock)
+
+        await cache.get(twitch, '1')
+        clock.now = 61
+        await cache.get(twitch, '1')
+
+        assert twitch.get_users.call_count == 2
+
+    async def test_concurrent_gets_share_one_request(self, mocker):
+        user = make_user(mocker, '1')
+        twitch = make_twitch(mocker, {'1': user})
+        cache = BroadcasterProfileCache(ttl=60)
+
+        results = await asyncio.gather(*(cache.get(twitch, '1') for _ in range(5)))
+
+        assert results == [user] * 5
+        twitch.get_users.assert_called_once()
+
+    async def test_get_unknown_broadcaster_returns_none(self, mocker):
+        twitch = make_twitch(mocker, {})
+        cache = BroadcasterProfileCache(ttl=60)
+
+        assert await cache.get(twitch, '404') is None
+        assert len(cache) == 0
+
+    async def test_prefetch_batches_and_skips_fresh_entries(self, mocker):
+        users = {str(i): make_user(mocker, str(i)) for i in range(150)}
+        twitch = make_twitch(mocker, users)
+        cache = BroadcasterProfileCache(ttl=60)
+        await cache.get(twitch, '0')
+        twitch.get_users.reset_mock()
+
+        fetched = await cache.prefetch(twitch, list(users))
+
+        assert fetched == 149
+        assert twitch.get_users.call_count == 2
+        assert len(twitch.get_users.call_args_list[0].kwargs['user_ids']) == 100
+        assert len(cache) == 150
+
+    async def test_prefetch_failure_is_not_raised(self, mocker):
+        twitch = mocker.MagicMock()
+        twitch.get_users = mocker.MagicMock(side_effect=TwitchAPIException('Unauthorized'))
+        cache = BroadcasterProfileCache(ttl=60)
+
+        assert await cache.prefetch(twitch, ['1']) == 0
+
+    async def test_prefetch_network_error_is_not_raised(self, mocker):
+        twitch = mocker.MagicMock()
+        twitch.get_users = mocker.MagicMock(side_effect=aiohttp.ClientConnectionError('Connection reset'))
+        cache = BroadcasterProfileCache(ttl=60)
+
+        assert await cache.prefetch(twitch, ['1']) == 0
+
+    async def test_invalidate(self, mocker):
+        twitch = make_twitch(mocker, {'1': make_user(mocker, '1')})
+        cache = BroadcasterProfileCache(ttl=60)
+        await cache.get(twitch, '1')
+
+        cache.invalidate('1')
+        await cache.get(twitch, '1')
+
+        assert twitch.get_users.call_count == 2
@@ -0,0 +1,103 @@
+import json
+import re
+
+import pytest
+from sqlalchemy import delete, select, text
+from sqlalchemy.dialects import postgresql
+
+from bot.models import Streamer, UserSubscription
+
+# The test checks whether an index could serve each query, not which plan Postgres would actually choose on
+# these tiny tables: sequential scans are disabled, and the anti-joins of the orphan sweeps are planned as nested
+# loops. The planner statistics come from a fixed dataset seeded and analyzed by the test, so the plans don't
+# depend on whatever rows, autovacuum and earlier tests left in the database.
+# Postgres can also filter on any column of an index while walking all of it, so an index scan only counts as a
+# lookup if the index's leading column is in its condition (uix_1 leads with user_id and can't serve most of these).
+HOT_QUERIES = {
+    'subscribers of a streamer': select(UserSubscription.guild_id, UserSubscription.user_id)
+    .where(UserSubscription.streamer_id == 1),
+    'unnotify': delete(UserSubscription).where(UserSubscription.user_id == 1, UserSubscription.guild_id == 2,
+                                               UserSubscription.streamer_id.in_([1, 3])),
+    'unnotifyall': delete(UserSubscription).where(UserSubscription.user_id == 1, UserSubscription.guild_id == 2),
+    'orphan sweep after unnotify': delete(Streamer).where(
+        Streamer.streamer_id.in_([1, 3]),
+        ~select(UserSubscription.id).where(UserSubscription.streamer_id == Streamer.streamer_id).exists()
+    ),
+    'notifs of a user in a guild': select(UserSubscription.streamer_id)
+    .where(UserSubscription.user_id == 1, UserSubscription.guild_id == 2),
+    'cascade delete by guild': delete(UserSubscription).where(UserSubscription.guild_id == 2),
+    'orphan check of one streamer': select(Streamer.streamer_id).where(
+        Streamer.streamer_id == 1,
+        ~select(UserSubscription.id).where(UserSubscription.streamer_id == Streamer.streamer_id).exists()
+    ),
+}
+
+# Queries that join user_subscriptions, checked with nested loops only
+ANTI_JOIN_QUERIES = {'orphan sweep after unnotify', 'orphan check of one streamer'}
+
+
+# 50 guilds, 2000 streamers and 1000 users subscribed to 20 streamers each, rolled back with the test session
+SEED_STATEMENTS = [
+    text("""
+        INSERT INTO guilds (guild_id, notification_channel_id, notification_mode, is_censored)
+        SELECT g, 1, 'optin', false FROM generate_series(1, 50) g
+        ON CONFLICT DO NOTHING
+    """),
+    text("""
+        INSERT INTO streamers (streamer_id, streamer_name, topic_sub_id)
+        SELECT s, 'streamer' || s, 'topic' || s FROM generate_series(1, 2000) s
+        ON CONFLICT DO NOTHING
+    """),
+    text("""
+        INSERT INTO user_subscriptions (user_id, guild_id, streamer_id)
+        SELECT i / 20, i % 50 + 1, i * 7 % 2000 + 1 FROM generate_series(0, 19999) i
+        ON CONFLICT DO NOTHING
+    """),
+    text('ANALYZE guilds, streamers, user_subscriptions'),
+]
+
+LEADING_COLUMNS = text("""
+    SELECT i.relname, a.attname
+    FROM pg_index x
+    JOIN pg_class i ON i.oid = x.indexrelid
+    JOIN pg_class t ON t.oid = x.indrelid
+    JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = x.indkey[0]
+    WHERE t.relname = :table
+""")
+
+
+def full_scans(plan: dict, table: str, leading_columns: dict[str, str]) -> list[str]:
+    """
+    Returns the scans of a table that read all of it: sequential scans, and index scans whose condition
+    doesn't use the leading column of the index.
+    """
+
+    scans = []
+    if plan['Node Type'] == 'Seq Scan' and plan['Relation Name'] == table:
+        scans.append('Seq Scan')
+    elif plan['Node Type'] in ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan') \
+            and plan['Index Name'] in leading_columns:
+        if not re.search(rf'(?<![.\w]){leading_columns[plan["Index Name"]]}\b', plan.get('Index Cond', '')):
+            scans.append(f"{plan['Node Type']} of {plan['Index Name']}")
+    for child in plan.get('Plans', []):
+        scans += full_scans(child, table, leading_columns)
+    return scans
+
+
+@pytest.mark.asyncio
+class TestQueryPlans:
+    @pytest.mark.parametrize('name', HOT_QUERIES)
+    async def test_hot_query_does_not_scan_user_subscriptions(self, test_session, name):
+        for statement in SEED_STATEMENTS:
+            await test_session.execute(statement)
+        await test_session.execute(text('SET LOCAL enable_seqscan = off'))
+        if name in ANTI_JOIN_QUERIES:
+            await test_session.execute(text('SET LOCAL enable_hashjoin = off'))
+            await test_session.execute(text('SET LOCAL enable_mergejoin = off'))
+        leading_columns = dict((await test_session.execute(LEADING_COLUMNS, {'table': 'user_subscriptions'})).all())
+        sql = HOT_QUERIES[name].compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True})
+
+        result = await test_session.scalar(text(f'EXPLAIN (FORMAT JSON) {sql}'))
+        plan = (result if isinstance(result, list) else json.loads(result))[0]['Plan']
+
+        assert full_scans(plan, 'user_subscriptions', leading_columns) == [], json.dumps(plan, indent=2)
@@ -0,0 +1,162 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import discord
+import pytest
+from discord.ext.commands import Context
+
+from bot.send_scheduler import TokenBucket, AdaptiveConcurrencyLimiter, SendScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def rate_limited_error(retry_after='0'):
+    response = MagicMock()
+    response.status = 429
+    response.headers = {'Retry-After': retry_after}
+    return discord.HTTPException(response, 'You are being rate limited.')
+
+
+class TestTokenBucket:
+    def test_burst_is_free_then_waits_are_paced(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1.0, capacity=5, clock=clock)
+
+        assert [bucket.reserve() for _ in range(5)] == [0.0] * 5
+        assert bucket.reserve() == pytest.approx(1.0)
+        assert bucket.reserve() == pytest.approx(2.0)
+
+    def test_tokens_refill_over_time(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2.0, capacity=2, clock=clock)
+        bucket.reserve()
+        bucket.reserve()
+
+        clock.now = 1.0
+
+        assert bucket.reserve() == 0.0
+        assert bucket.is_idle() is False
+
+    def test_block_for_delays_next_token(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1.0, capacity=5, clock=clock)
+
+        bucket.block_for(3.0)
+
+        assert bucket.reserve() == pytest.approx(3.0)
+
+
+@pytest.mark.asyncio
+class TestAdaptiveConcurrencyLimiter:
+    async def test_rate_limit_halves_and_fast_sends_grow(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=8, minimum=1, maximum=10, latency_threshold=1.0)
+
+        await limiter.acquire()
+        await limiter.release(None, rate_limited=True)
+        assert limiter.limit == 4
+
+        await limiter.acquire()
+        await limiter.release(0.1)
+        assert limiter.limit == 5
+
+        await limiter.acquire()
+        await limiter.release(5.0)
+        assert limiter.limit == 4
+        assert limiter.in_flight == 0
+
+    async def test_limit_never_goes_below_minimum(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=2, minimum=1, maximum=10, latency_threshold=1.0)
+
+        for _ in range(3):
+            await limiter.acquire()
+            await limiter.release(None, rate_limited=True)
+
+        assert limiter.limit == 1
+
+    async def test_acquire_waits_for_free_slot(self):
+        limiter = AdaptiveConcurrencyLimiter(initial=1, minimum=1, maximum=1, latency_threshold=1.0)
+        await limiter.acquire()
+
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        await limiter.release(0.1)
+        await asyncio.wait_for(waiter, 1)
+        assert limiter.in_flight == 1
+
+
+@pytest.mark.asyncio
+class TestSendScheduler:
+    async def test_send_passes_arguments_through(self):
+        scheduler = SendScheduler()
+        channel = MagicMock(spec=discord.TextChannel)
+        channel.id = 1
+        channel.send = AsyncMock(return_value='message')
+
+        result = await scheduler.send(channel, 'hello', embed='embed')
+
+        assert result == 'message'
+        channel.send.assert_called_once_with('hello', embed='embed')
+
+    async def test_context_routes_by_channel(self):
+        ctx = MagicMock(spec=Context)
+        ctx.channel.id = 42
+
+        assert SendScheduler.route_key(ctx) == 42
+
+    async def test_retries_after_rate_limit(self, mocker):
+        sleep = mocker.patch('bot.send_scheduler.asyncio.sleep', new=AsyncMock())
+        scheduler = SendScheduler(max_concurrency=4)
+        channel = MagicMock(spec=discord.TextChannel)
+        channel.id = 1
+        channel.send = AsyncMock(side_effect=[rate_limited_error('2.5'), 'message'])
+
+        result = await scheduler.send(channel, content='hi')
+
+        assert result == 'message'
+        assert channel.send.call_count == 2
+        assert scheduler.limiter.limit == 3
+        assert sleep.await_args.args[0] == pytest.approx(2.5, abs=0.1)
+
+    async def test_gives_up_after_max_retries(self, mocker):
+        mocker.patch('bot.send_scheduler.asyncio.sleep', new=AsyncMock())
+        scheduler = SendScheduler(max_retries=1)
+        channel = MagicMock(spec=discord.TextChannel)
+        channel.id = 1
+        channel.send = AsyncMock(side_effect=discord.RateLimited(1.0))
+
+        with pytest.raises(discord.RateLimited):
+            await scheduler.send(channel, content='hi')
+
+        assert channel.send.call_count == 2
+
+    async def test_other_errors_are_not_retried(self):
+        scheduler = SendScheduler()
+        channel = MagicMock(spec=discord.TextChannel)
+        channel.id = 1
+        channel.send = AsyncMock(side_effect=Exception('Forbidden'))
+
+        with pytest.raises(Exception, match='Forbidden'):
+            await scheduler.send(channel, content='hi')
+
+        assert channel.send.call_count == 1
+        assert scheduler.limiter.in_flight == 0
+
+    async def test_channel_burst_is_paced(self, mocker):
+        sleep = mocker.patch('bot.send_scheduler.asyncio.sleep', new=AsyncMock())
+        scheduler = SendScheduler(channel_rate=1.0, channel_burst=2)
+        channel = MagicMock(spec=discord.TextChannel)
+        channel.id = 1
+        channel.send = AsyncMock()
+
+        for _ in range(3):
+            await scheduler.send(channel, content='hi')
+
+        assert sleep.await_count == 1
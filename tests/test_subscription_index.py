@@ -0,0 +1,127 @@
+import pytest
+
+from bot.models import Guild, Streamer, UserSubscription
+from bot.subscription_index import SubscriptionIndex, GuildConfig
+
+
+class TestSubscriptionIndex:
+
+    def test_lookup_unknown_streamer(self):
+        assert SubscriptionIndex().lookup('1') == []
+
+    def test_add_subscriptions_and_lookup(self):
+        index = SubscriptionIndex()
+        index.set_guild('10', '100', 'optin', False)
+        index.add_subscriptions('10', 'u1', ['s1', 's2'])
+        index.add_subscriptions('10', 'u2', ['s1'])
+
+        assert index.lookup('s1') == [(GuildConfig('10', '100', 'optin', False), frozenset({'u1', 'u2'}))]
+        assert index.lookup('s2') == [(GuildConfig('10', '100', 'optin', False), frozenset({'u1'}))]
+
+    def test_lookup_skips_guilds_without_config(self):
+        index = SubscriptionIndex()
+        index.add_subscriptions('10', 'u1', ['s1'])
+
+        assert index.lookup('s1') == []
+
+    def test_lookup_returns_snapshot(self):
+        index = SubscriptionIndex()
+        index.set_guild('10', '100', 'optin', False)
+        index.add_subscriptions('10', 'u1', ['s1'])
+
+        _, user_ids = index.lookup('s1')[0]
+        index.add_subscriptions('10', 'u2', ['s1'])
+
+        assert user_ids == frozenset({'u1'})
+
+    def test_remove_subscriptions(self):
+        index = SubscriptionIndex()
+        index.set_guild('10', '100', 'optin', False)
+        index.add_subscriptions('10', 'u1', ['s1', 's2'])
+        index.add_subscriptions('10', 'u2', ['s1'])
+
+        index.remove_subscriptions('10', 'u1', ['s1', 's2', 'unknown'])
+
+        assert index.lookup('s1') == [(GuildConfig('10', '100', 'optin', False), frozenset({'u2'}))]
+        assert index.lookup('s2') == []
+
+    def test_set_guild_updates_config(self):
+        index = SubscriptionIndex()
+        index.set_guild('10', '100', 'optin', False)
+        index.add_subscriptions('10', 'u1', ['s1'])
+
+        index.set_guild('10', '200', 'global', True)
+
+        assert index.lookup('s1')[0][0] == GuildConfig('10', '200', 'global', True)
+
+    def test_get_guild(self):
+        index = SubscriptionIndex()
+        index.set_guild('10', '100', 'optin', False)
+
+        assert index.get_guild('10') == GuildConfig('10', '100', 'optin', False)
+        assert index.get_guild('20') is None
+
+    def test_remove_guild(self):
+        index = SubscriptionIndex()
+        index.set_guild('10', '100', 'optin', False)
+        index.set_guild('20', '200', 'optin', False)
+        index.add_subscriptions('10', 'u1', ['s1', 's2'])
+        index.add_subscriptions('20', 'u1', ['s1'])
+
+        index.remove_guild('10')
+
+        assert index.lookup('s1') == [(GuildConfig('20', '200', 'optin', False), frozenset({'u1'}))]
+        assert index.lookup('s2') == []
+
+
+@pytest.mark.asyncio
+class TestSubscriptionIndexLoad:
+
+    async def test_load_reads_guilds_and_subscriptions(self, test_session):
+        test_session.add_all([
+            Guild(guild_id=9001, notification_channel_id=9002, notification_mode='global', is_censored=True),
+            Streamer(streamer_id=9003, streamer_name='Streamer9003', topic_sub_id='t9003'),
+        ])
+        await test_session.flush()
+        test_session.add_all([
+            UserSubscription(user_id=1, guild_id=9001, streamer_id=9003),
+            UserSubscription(user_id=2, guild_id=9001, streamer_id=9003),
+        ])
+        await test_session.flush()
+
+        index = SubscriptionIndex()
+        index.add_subscriptions(1, 1, [9003])
+        await index.load(test_session)
+
+        assert index.lookup(9003) == [
+            (GuildConfig(9001, 9002, 'global', True), frozenset({1, 2}))
+        ]
+
+    async def test_load_reads_one_row_per_streamer_and_guild(self, test_session):
+        test_session.add_all([
+            Guild(guild_id=9001, notification_channel_id=9002, notification_mode='optin', is_censored=False),
+            Guild(guild_id=9011, notification_channel_id=9012, notification_mode='optin', is_censored=False),
+            Streamer(streamer_id=9003, streamer_name='Streamer9003', topic_sub_id='t9003'),
+        ])
+        await test_session.flush()
+        test_session.add_all(
+            [UserSubscription(user_id=i, guild_id=9001, streamer_id=9003) for i in range(50)]
+            + [UserSubscription(user_id=0, guild_id=9011, streamer_id=9003)]
+        )
+        await test_session.flush()
+        execute = test_session.execute
+        results = []
+
+        async def record_execute(*args, **kwargs):
+            result = (await execute(*args, **kwargs)).all()
+            results.append(result)
+            return result
+
+        test_session.execute = record_execute
+        index = SubscriptionIndex()
+        await index.load(test_session)
+
+        subscription_rows = [row for row in results[1] if row.streamer_id == 9003]
+        assert len(subscription_rows) == 2
+        assert dict(index.lookup(9003))[GuildConfig(9001, 9002, 'optin', False)] == \
+            frozenset(range(50))